@@ -1,154 +1,364 @@
 import sys
-from enum import Enum, auto
-from collections import namedtuple
+from bisect import bisect_left, bisect_right
+from types import MappingProxyType
 
-class Token(Enum):
+
+class Token:
     '''
     Calculate grammar tokens.
+
+    The token kinds are built once, below, as plain constants instead of an
+    Enum, so starting the lexer doesn't pay for importing enum and building
+    an Enum class.
+    '''
+    __slots__ = ('name', 'value')
+
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+    def __repr__(self):
+        return f'<Token.{self.name}: {self.value}>'
+
+    def __reduce__(self):
+        # unpickle to the same constant, so `is`/== still work across processes
+        return (getattr, (Token, self.name))
+
+
+Token.INVALID = Token('INVALID', 1)
+Token.EOF = Token('EOF', 2)
+Token.LPAREN = Token('LPAREN', 3)
+Token.RPAREN = Token('RPAREN', 4)
+Token.PROC = Token('PROC', 5)
+Token.COMMA = Token('COMMA', 6)
+Token.LBRACK = Token('LBRACK', 7)
+Token.RBRACK = Token('RBRACK', 8)
+Token.BEGIN = Token('BEGIN', 9)
+Token.END = Token('END', 10)
+Token.INTLIT = Token('INTLIT', 11)
+Token.NUMTYPE = Token('NUMTYPE', 12)
+Token.CHARTYPE = Token('CHARTYPE', 13)
+Token.ASS = Token('ASS', 14)
+Token.SWAP = Token('SWAP', 15)
+Token.IF = Token('IF', 16)
+Token.ELSE = Token('ELSE', 17)
+Token.WHILE = Token('WHILE', 18)
+Token.EQ = Token('EQ', 19)
+Token.NOEQ = Token('NOEQ', 20)
+Token.LT = Token('LT', 21)
+Token.LTE = Token('LTE', 22)
+Token.GT = Token('GT', 23)
+Token.GTE = Token('GTE', 24)
+Token.PLUS = Token('PLUS', 25)
+Token.MINUS = Token('MINUS', 26)
+Token.TIMES = Token('TIMES', 27)
+Token.DIV = Token('DIV', 28)
+Token.EXP = Token('EXP', 29)
+Token.PRINT = Token('PRINT', 30)
+Token.READ = Token('READ', 31)
+Token.FLOATLIT = Token('FLOATLIT', 32)
+Token.CHARLIT = Token('CHARLIT', 33)
+Token.STRING = Token('STRING', 34)
+Token.VARIABLE = Token('VARIABLE', 35)
+
+
+# Scanning tables, built once at import rather than on every call. They
+# are read-only, so lexers running in different threads can share them.
+SINGLE_TOKENS = MappingProxyType({
+    '(': Token.LPAREN,
+    ')': Token.RPAREN,
+    ',': Token.COMMA,
+    '[': Token.LBRACK,
+    ']': Token.RBRACK,
+    '+': Token.PLUS,
+    '-': Token.MINUS,
+    '/': Token.DIV,
+    "=": Token.EQ,
+    "~=": Token.NOEQ,
+})
+
+MULTI_FIXED_TOKENS = (
+    (":=", Token.ASS),
+    (":=:", Token.SWAP),
+    ("<", Token.LT),
+    ("<=", Token.LTE),
+    (">", Token.GT),
+    (">=", Token.GTE),
+    ("*", Token.TIMES),
+    ("**", Token.EXP),
+)
+
+# ^^^^^ Modify only the keyword list to add keywords ^^^^^^^
+KEYWORDS = MappingProxyType({
+    "PROC": Token.PROC,
+    "BEGIN": Token.BEGIN,
+    "END": Token.END,
+    "NUMBER": Token.NUMTYPE,
+    "CHARLIT": Token.CHARTYPE,
+    "IF": Token.IF,
+    "ELSE": Token.ELSE,
+    "WHILE": Token.WHILE,
+    "PRINT": Token.PRINT,
+    "READ": Token.READ,
+})
+
+
+# how much source the lexer pulls from its file at a time
+CHUNK_SIZE = 65536
+
+# how much whitespace is looked at first when skipping a run; a long run
+# is gone through in doubling windows from there
+SPACE_WINDOW = 64
+
+# marks a literal value that hasn't been decoded yet
+_UNDECODED = object()
+
+
+class LineIndex:
+    '''
+    Where the lines are in one buffer of source text.
+
+    Holds the buffer positions of its newlines, the line number of its
+    first character, and the position of the last newline before it
+    (relative to the buffer, so negative). The line and column of any
+    position are found by binary search, only when someone asks.
+    '''
+    __slots__ = ('newlines', 'first_line', 'last_newline')
+
+    def __init__(self, newlines, first_line, last_newline):
+        self.newlines = newlines
+        self.first_line = first_line
+        self.last_newline = last_newline
+
+    def position(self, pos):
+        #A newline counts as the first char (column 0) of the line it starts
+        k = bisect_right(self.newlines, pos)
+        line_start = self.newlines[k - 1] if k else self.last_newline
+        return self.first_line + k, pos - line_start
+
+    def refill(self, text, keep, data):
+        #Index for text[keep:] + data. This makes a new index rather than
+        #changing this one, which tokens made from text still point at.
+        k = bisect_left(self.newlines, keep)
+        newlines = [nl - keep for nl in self.newlines[k:]]
+
+        offset = len(text) - keep
+        nl = data.find('\n')
+        while nl >= 0:
+            newlines.append(offset + nl)
+            nl = data.find('\n', nl + 1)
+
+        last_newline = self.newlines[k - 1] if k else self.last_newline
+        return LineIndex(newlines, self.first_line + k, last_newline - keep)
+
+
+class TokenDetail:
+    '''
+    A scanned token.
+
+    The lexeme is not copied out of the source. The token keeps the
+    buffered source text it was scanned from along with the lexeme's
+    start and end, and only slices it out when asked. INTLIT/FLOATLIT
+    values are decoded the first time they are asked for, then cached.
+    Line and column are worked out from the buffer's LineIndex, also
+    only when asked for.
     '''
-    INVALID = auto()
-    EOF = auto()
-    LPAREN = auto()
-    RPAREN = auto()
-    PROC = auto()
-    COMMA = auto()
-    LBRACK = auto()
-    RBRACK = auto()
-    BEGIN = auto()
-    END = auto()
-    INTLIT = auto()
-    NUMTYPE = auto()
-    CHARTYPE = auto()
-    ASS = auto()
-    SWAP = auto()
-    IF = auto()
-    ELSE = auto()
-    WHILE = auto()
-    EQ = auto()
-    NOEQ = auto()
-    LT = auto()
-    LTE = auto()
-    GT = auto()
-    GTE = auto()
-    PLUS = auto()
-    MINUS = auto()
-    TIMES = auto()
-    DIV = auto()
-    EXP = auto()
-    PRINT = auto()
-    READ = auto()
-    FLOATLIT = auto()
-    CHARLIT = auto()
-    STRING = auto()
-    VARIABLE = auto()
-
-
-TokenDetail = namedtuple('TokenDetail', ('token', 'lexeme', 'value', 'line', 'col'))
+    __slots__ = ('token', '__text', '__start', '__end', '__lines', '__value')
+
+    def __init__(self, token, text, start, end, lines):
+        self.token = token
+        self.__text = text
+        self.__start = start
+        self.__end = end
+        self.__lines = lines
+        self.__value = _UNDECODED
+
+    @property
+    def lexeme(self):
+        return self.__text[self.__start:self.__end]
+
+    @property
+    def line(self):
+        return self.__lines.position(self.__start)[0]
+
+    @property
+    def col(self):
+        return self.__lines.position(self.__start)[1]
+
+    @property
+    def value(self):
+        if self.__value is _UNDECODED:
+            if self.token == Token.INTLIT:
+                self.__value = int(self.lexeme)
+            elif self.token == Token.FLOATLIT:
+                self.__value = float(self.lexeme)
+            else:
+                self.__value = None
+
+        return self.__value
+
+    def __eq__(self, other):
+        if not isinstance(other, TokenDetail):
+            return NotImplemented
+        return (self.token, self.lexeme, self.line,
+                self.col) == (other.token, other.lexeme, other.line, other.col)
+
+    def __hash__(self):
+        return hash((self.token, self.lexeme, self.line, self.col))
+
+    def __reduce__(self):
+        # pickle just the lexeme and its position, not the buffer around it
+        line, col = self.__lines.position(self.__start)
+        return (_unpickle_token, (self.token, self.lexeme, line, col))
+
+    def __repr__(self):
+        return (f"TokenDetail(token={self.token!r}, lexeme={self.lexeme!r}, "
+                f"value={self.value!r}, line={self.line}, col={self.col})")
+
+
+def _unpickle_token(token, lexeme, line, col):
+    return TokenDetail(token, lexeme, 0, len(lexeme), LineIndex((), line, -col))
 
 
 class Lexer:
-    def __init__(self, lex_file=sys.stdin):
-        #set up scanning
+
+    def __init__(self, lex_file=sys.stdin, line=1, col=1,
+                 chunk_size=CHUNK_SIZE):
+        #set up scanning, line and col are where lex_file starts in the source.
+        #All scanning state lives on the instance, so separate lexers can run
+        #in separate threads.
         self.__lex_file = lex_file
-        self.__line = 1
-        self.__col = 0
+        self.__chunk_size = chunk_size
         self.__cur_char = None
 
+        #buffered source, the current char's index in it, and where the
+        #token being scanned starts (the buffer is never trimmed past that)
+        self.__text = ''
+        self.__pos = -1
+        self.__start = 0
+
+        #newlines in the buffer, for working out lines and columns
+        self.__lines = LineIndex([], line, -col)
+
         #scan first char
         self.consume()
 
         #store current token
-        self.__tok = TokenDetail(Token.INVALID, '', None, 0, 0)
+        self.__tok = TokenDetail(Token.INVALID, '', 0, 0, LineIndex([], 0, 0))
 
     def consume(self):
         #Consume character from stream, makes it the lexer's current character
-        self.__cur_char = self.__lex_file.read(1)
-        self.__col += 1
-        if self.__cur_char == '\n':
-            self.__col = 0
-            self.__line += 1
+        self.__pos += 1
+        if self.__pos >= len(self.__text):
+            self.__fill()
+        self.__cur_char = self.__text[self.__pos:self.__pos + 1]
+
+    def __fill(self):
+        #Read the next chunk, dropping what is before the current token.
+        #Tokens already made keep the old buffer alive for as long as needed.
+        keep = self.__start
+        #read at least as much as is kept, so a token spanning many chunks
+        #(a long string) is copied a few times in all, not once per chunk
+        data = self.__lex_file.read(max(self.__chunk_size,
+                                         len(self.__text) - keep))
+        self.__lines = self.__lines.refill(self.__text, keep, data)
+        self.__text = self.__text[keep:] + data
+        self.__pos -= keep
+        self.__start = 0
+
+    def __skip_to(self, stop, drop=False):
+        #Jump straight to the next stop char, or the end of the file, instead
+        #of consuming one char at a time. With drop, what is skipped isn't
+        #part of a token, so the buffer lets go of it at every refill.
+        while True:
+            found = self.__text.find(stop, self.__pos)
+            if found >= 0:
+                self.__pos = found
+                self.__cur_char = stop
+                return
+
+            self.__pos = len(self.__text)
+            if drop:
+                self.__start = self.__pos
+            self.__fill()
+            if self.__pos >= len(self.__text):
+                self.__cur_char = ''
+                return
+
+    def __skip_space(self):
+        #Jump over a run of whitespace, across chunks if need be. lstrip()
+        #does the scanning, on a window of the buffer so that a short run
+        #doesn't cost a copy of the rest of it.
+        window = SPACE_WINDOW
+        while True:
+            part = self.__text[self.__pos:self.__pos + window]
+            rest = part.lstrip()
+            self.__pos += len(part) - len(rest)
+            if rest:
+                break
+
+            if self.__pos < len(self.__text):
+                window *= 2
+                continue
+
+            # whitespace is never kept, however long the run
+            self.__start = self.__pos
+            self.__fill()
+            if self.__pos >= len(self.__text):
+                break
 
+        self.__cur_char = self.__text[self.__pos:self.__pos + 1]
 
     def skip_space_and_comments(self):
         while self.__cur_char.isspace() or self.__cur_char == '#':
+            # none of this is part of a token, so the buffer can let go of it
+            self.__start = self.__pos
             if self.__cur_char == '#':
-                # consume the rest of the line
-                while self.__cur_char and self.__cur_char != '\n':
-                    self.consume()
-
-            # consume all the whitespace
-            while self.__cur_char.isspace():
-                self.consume()
-
+                # skip the rest of the line
+                self.__skip_to('\n', drop=True)
+            else:
+                self.__skip_space()
 
     def get_char(self):
         return str(self.__cur_char)
 
-
     def get_line(self):
-        return self.__line
-
+        return self.__lines.position(self.__pos)[0]
 
     def get_col(self):
-        return self.__col
-
+        return self.__lines.position(self.__pos)[1]
 
     def get_tok(self):
         return self.__tok
 
+    def __create_tok(self, token, start=None, end=None):
+        #the lexeme defaults to the current character
+        if start is None:
+            start = self.__pos
+        if end is None:
+            end = start + 1
 
-    def __create_tok(self, token, lexeme=None, value=None, line=None, col=None):
-        if not lexeme:
-            lexem = self.__cur_char
-        if not line:
-            line = self.__line
-        if not col:
-            col = self.__col
-
-        return TokenDetail(token, lexeme, value, line, col)
-
+        return TokenDetail(token, self.__text, start, end, self.__lines)
 
     def __lex_single(self):
-        t = [
-            ('(', Token.LPAREN),
-            (')', Token.RPAREN),
-            (',', Token.COMMA),
-            ('[', Token.LBRACK),
-            (']', Token.RBRACK),
-            ('+', Token.PLUS),
-            ('-', Token.MINUS),
-            ('/', Token.DIV),
-            ("=", Token.EQ),
-            ("~=", Token.NOEQ),
-        ]
-        for tok in t:
-            if self.__cur_char == tok[0]:
-                self.__tok = self.__create_tok(tok[1])
-                self.consume()
-                return True
+        t = SINGLE_TOKENS.get(self.__cur_char)
+        if t is None:
+            return False
 
-        return False
+        self.__tok = self.__create_tok(t)
+        self.consume()
+        return True
 
     def __lex_multi_fixed(self):
-        t = [
-                (":=", Token.ASS),
-                (":=:", Token.SWAP),
-                ("<", Token.LT),
-                ("<=", Token.LTE),
-                (">", Token.GT),
-                (">=", Token.GTE),
-                ("*", Token.TIMES),
-                ("**", Token.EXP),
-            ]
+        t = MULTI_FIXED_TOKENS
 
         cur_lex = ""
-        line = self.__line
-        col = self.__col
-        while len(t) > 1:
+        # stop at the end of the file, where the candidates can't narrow
+        while len(t) > 1 and self.__cur_char:
             trial_lex = cur_lex + self.__cur_char
 
             t_old = t
-            t = [ tok for tok in t if tok[0].startswith(trial_lex) ]
+            t = [tok for tok in t if tok[0].startswith(trial_lex)]
 
             if len(t) == 0:
                 t = t_old
@@ -160,12 +370,12 @@ class Lexer:
         if len(cur_lex) == 0:
             return False
 
-        t = [ tok for tok in t if tok[0] == cur_lex ]
+        t = [tok for tok in t if tok[0] == cur_lex]
 
         if len(t) < 1:
-            self.__tok = self.__create_tok(Token.INVALID, lexeme = cur_lex, line=line, col=col)
+            self.__tok = self.__create_tok(Token.INVALID, self.__start, self.__pos)
         else:
-            self.__tok = self.__create_tok(t[0][1], lexeme = cur_lex, line=line, col=col)
+            self.__tok = self.__create_tok(t[0][1], self.__start, self.__pos)
 
         return True
 
@@ -181,68 +391,59 @@ class Lexer:
         return False
 
     def __lex_number(self):
-        cur_lex = ""
-        line = self.__line
-        col = self.__col
-
         while self.__cur_char.isdigit():
-            cur_lex += self.__cur_char
             self.consume()
 
         t = Token.INTLIT
 
         if self.__cur_char == ".":
             t = Token.FLOATLIT
-            cur_lex += self.__cur_char
             self.consume()
             while self.__cur_char.isdigit():
-                cur_lex += self.__cur_char
                 self.consume()
 
-        if cur_lex[-1] == '.':
+        if self.__text[self.__pos - 1] == '.':
             t = Token.INVALID
 
-        if t == Token.INTLIT:
-            v = int(cur_lex)
-        elif t == Token.FLOATLIT:
-            v = float(cur_lex)
-        else:
-            v = None
-
-        self.__tok = self.__create_tok(t, cur_lex, v, line, col)
+        # the value itself is decoded by the token when it is first used
+        self.__tok = self.__create_tok(t, self.__start, self.__pos)
         return True
 
     def __lex_string(self):
-        cur_lex = ''
         self.consume()
-        line = self.__line
-        col = self.__col
+        self.__skip_to('\"')
 
-        while self.__cur_char != '\"':
-            cur_lex += self.__cur_char
-            self.consume()
+        if not self.__cur_char:
+            # ran into the end of the file, the string was never closed
+            self.__tok = self.__create_tok(Token.INVALID, self.__start, self.__pos)
+            return True
 
         self.consume()
 
-        self.__tok = self.__create_tok(Token.STRING, cur_lex, line=line, col=col)
+        self.__tok = self.__create_tok(Token.STRING, self.__start + 1,
+                                       self.__pos - 1)
         return True
 
-
     def __lex_char(self):
         isvalidchar = True
-        cur_lex = ''
         self.consume()
-        line = self.__line
-        col = self.__col
 
-        while self.__cur_char != '\'':
-            cur_lex += self.__cur_char
+        while self.__cur_char and self.__cur_char != '\'':
             self.consume()
 
+        if not self.__cur_char:
+            # ran into the end of the file, the literal was never closed
+            self.__tok = self.__create_tok(Token.INVALID, self.__start, self.__pos)
+            return True
+
         self.consume()
 
+        start = self.__start + 1
+        end = self.__pos - 1
+        cur_lex = self.__text[start:end]
+
         if len(cur_lex) == 1:
-            self.__tok = self.__create_tok(Token.CHARLIT, cur_lex, line=line, col=col)
+            self.__tok = self.__create_tok(Token.CHARLIT, start, end)
 
         elif len(cur_lex) == 2:
             escs = ["\\n", "\\t", "\\\'", "\\\""]
@@ -255,53 +456,29 @@ class Lexer:
             isvalidchar = False
 
         if isvalidchar:
-            self.__tok = self.__create_tok(Token.CHARLIT, cur_lex, line=line, col=col)
+            self.__tok = self.__create_tok(Token.CHARLIT, start, end)
         else:
+            # reported where it always was, just past the closing quote
             self.__tok = self.__create_tok(Token.INVALID)
 
-        print(cur_lex)
         return True
 
-
     def __lex_keyword_or_var(self):
-        kw = [
-                ("PROC", Token.PROC),
-                ("BEGIN", Token.BEGIN),
-                ("END", Token.END),
-                ("NUMBER", Token.NUMTYPE),
-                ("CHARLIT", Token.CHARTYPE),
-                ("IF", Token.IF),
-                ("ELSE", Token.ELSE),
-                ("WHILE", Token.WHILE),
-                ("PRINT", Token.PRINT),
-                ("READ", Token.READ),
-        ]
-
-        # ^^^^^ Modify only the keyword list to use this function ^^^^^^^
-
-        # start things off
-        cur_lex = ''
-        line = self.__line
-        col = self.__col
-
-        # accumulate all consistent characters
-        while self.__cur_char.isalpha() or self.__cur_char.isdigit() or self.__cur_char == '_':
-            cur_lex += self.__cur_char
+        # skip over all consistent characters
+        while self.__cur_char.isalpha() or self.__cur_char.isdigit(
+        ) or self.__cur_char == '_':
             self.consume()
 
         # check if it's a keyword
-        kw = [ tok for tok in kw if tok[0] == cur_lex ]
-        if len(kw) == 1:
-            t = kw[0][1]
-        else:
-            t = Token.VARIABLE
+        t = KEYWORDS.get(self.__text[self.__start:self.__pos], Token.VARIABLE)
 
-        self.__tok = self.__create_tok(t, cur_lex, line=line, col=col)
+        self.__tok = self.__create_tok(t, self.__start, self.__pos)
         return True
 
-
     def next(self):
+        self.__start = self.__pos
         self.skip_space_and_comments()
+        self.__start = self.__pos
 
         if not self.__cur_char:
             self.__tok = self.__create_tok(Token.EOF)
@@ -0,0 +1,188 @@
+"""
+An asyncio front end for the lexer.
+
+AsyncLexer reads an asyncio.StreamReader a chunk at a time and yields
+tokens with `async for`, so one event loop can tokenize many
+connections at once:
+
+    async for tok in AsyncLexer(reader):
+      ...
+
+The scanning itself is still done by Lexer, on a thread of its own.
+Lexer reads from a file-like object that the event loop feeds with the
+chunks it receives. When the lexer has used up everything received so
+far, its read waits, on the lexer's thread, for the next chunk and then
+carries on from exactly where it was. A token, comment or string split
+across any number of chunks is scanned once, as it would be from a
+file, and read only returns '' when the stream has really ended.
+
+Tokens are handed to the event loop in batches, each time the lexer
+runs out of data, so the loop isn't woken once per token. The next
+chunk is only read from the stream once the tokens handed over have
+been taken, so a slow consumer holds back reading instead of letting
+tokens pile up.
+
+An AsyncLexer given up on before the end of its stream should be
+closed with aclose(), so its thread can finish.
+"""
+import codecs
+import asyncio
+import threading
+from collections import deque
+from lexer import Token, Lexer
+
+
+class _ChunkSource:
+  """
+    File-like object over the chunks fed in so far. read() is called on
+    the lexer's thread and waits for feed() when there is nothing left.
+    """
+
+  def __init__(self, hungry):
+    #hungry(size) is called, on the lexer's thread, just before read()
+    #starts waiting for more
+    self.__hungry = hungry
+    self.__fed = threading.Condition()
+    self.__buf = ''
+    self.__pos = 0
+    self.__eof = False
+
+  def feed(self, data, eof=False):
+    with self.__fed:
+      self.__buf = self.__buf[self.__pos:] + data
+      self.__pos = 0
+      self.__eof = self.__eof or eof
+      self.__fed.notify()
+
+  def read(self, size=-1):
+    with self.__fed:
+      if self.__pos >= len(self.__buf) and not self.__eof:
+        self.__hungry(size)
+        while self.__pos >= len(self.__buf) and not self.__eof:
+          self.__fed.wait()
+
+      end = len(self.__buf) if size < 0 else self.__pos + size
+      data = self.__buf[self.__pos:end]
+      self.__pos += len(data)
+      return data
+
+
+class AsyncLexer:
+  """
+    Yields the tokens of an asyncio.StreamReader, up to (not including)
+    the EOF token.
+    """
+
+  def __init__(self, reader, chunk_size=65536, encoding='utf-8'):
+    self.__reader = reader
+    self.__chunk_size = chunk_size
+    # chunks can end part way through a multi-byte character
+    self.__decoder = codecs.getincrementaldecoder(encoding)()
+    self.__source = _ChunkSource(self.__hungry)
+    self.__tokens = deque()
+    self.__wants = None
+    self.__error = None
+    self.__done = False
+    self.__thread = None
+    self.__loop = None
+    self.__ready = None
+
+    #what the lexer's thread hands over, guarded by __lock: tokens, how
+    #much it asked for if it is waiting, and whether it has finished
+    #(and how)
+    self.__lock = threading.Lock()
+    self.__handed = []
+    self.__asked = None
+    self.__finished = False
+    self.__failed = None
+
+    #tokens scanned but not handed over yet, only used on the lexer's thread
+    self.__batch = []
+
+  def __aiter__(self):
+    return self
+
+  async def __anext__(self):
+    while not self.__tokens:
+      if self.__error is not None:
+        error, self.__error = self.__error, None
+        self.__done = True
+        raise error
+      if self.__done:
+        raise StopAsyncIteration
+
+      if self.__thread is None:
+        self.__start()
+      elif self.__wants is not None:
+        wants, self.__wants = self.__wants, None
+        await self.__fill(wants)
+
+      await self.__ready.wait()
+      self.__ready.clear()
+      self.__collect()
+
+    return self.__tokens.popleft()
+
+  async def aclose(self):
+    """
+        Stop reading the stream. The lexer's thread finishes on what it
+        already has.
+        """
+    self.__source.feed('', eof=True)
+    self.__done = True
+
+  def __start(self):
+    self.__loop = asyncio.get_running_loop()
+    self.__ready = asyncio.Event()
+    self.__thread = threading.Thread(target=self.__scan, daemon=True,
+                                     name='AsyncLexer')
+    self.__thread.start()
+
+  async def __fill(self, size):
+    # read at least what the lexer asked for: it asks for more while it is
+    # part way through a long token, so that isn't copied once per chunk
+    try:
+      data = await self.__reader.read(max(self.__chunk_size, size))
+      self.__source.feed(self.__decoder.decode(data, final=not data),
+                         eof=not data)
+    except BaseException:
+      # the lexer's thread would otherwise wait for data forever
+      self.__source.feed('', eof=True)
+      raise
+
+  def __collect(self):
+    with self.__lock:
+      self.__tokens.extend(self.__handed)
+      self.__handed = []
+      self.__wants, self.__asked = self.__asked, None
+      if self.__finished:
+        self.__done = True
+        self.__error = self.__failed
+
+  def __scan(self):
+    #The lexer's thread: scan the whole stream
+    failed = None
+    try:
+      lexer = Lexer(self.__source)
+      while lexer.next().token != Token.EOF:
+        self.__batch.append(lexer.get_tok())
+    except Exception as e:
+      failed = e
+    self.__hand_over(finished=True, failed=failed)
+
+  def __hungry(self, size):
+    self.__hand_over(asked=size)
+
+  def __hand_over(self, asked=None, finished=False, failed=None):
+    #Give the event loop the tokens scanned so far and wake it
+    with self.__lock:
+      self.__handed.extend(self.__batch)
+      self.__asked = asked
+      self.__finished = finished
+      self.__failed = failed
+    self.__batch = []
+    try:
+      self.__loop.call_soon_threadsafe(self.__ready.set)
+    except RuntimeError:
+      # the event loop has gone, nobody is waiting for these
+      pass
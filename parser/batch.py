@@ -0,0 +1,126 @@
+"""
+Batch driver for the lexer and parser.
+
+Lexes and parses many FunLang files in one run. The files are spread
+over a process pool (or, with --threads, a thread pool), with the
+largest ones handed out first so one big file doesn't end up alone at
+the back of the queue. Results are printed one line per file, in the
+order the files were given, as soon as each one (and everything before
+it) is done.
+
+Each file gets its own Lexer and Parser, and they share nothing that
+changes, so threads are safe. On a CPython with the GIL they only help
+with waiting on I/O; on a free-threaded build they parse in parallel
+without the process pool's cost of sending results between processes.
+
+    python batch.py [-j JOBS] [--threads] FILE_OR_GLOB...
+"""
+import os
+import sys
+import glob
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from lexer import Lexer
+from parser_start import Parser, ParserError
+
+
+def available_cores():
+  """
+    Number of cores this process is allowed to run on.
+    """
+  if hasattr(os, 'sched_getaffinity'):
+    return len(os.sched_getaffinity(0))
+  return os.cpu_count() or 1
+
+
+def expand(patterns):
+  """
+    Expand file names and globs, keeping the order they were given in.
+    Only regular files are kept, since ** also matches directories. A
+    pattern that matches no files is passed through, so it gets reported
+    (as missing, or as a directory) instead of silently vanishing.
+    """
+  paths = []
+  for pattern in patterns:
+    matches = sorted(path for path in glob.glob(pattern, recursive=True)
+                     if os.path.isfile(path))
+    paths.extend(matches if matches else [pattern])
+  return paths
+
+
+def diagnostic(e):
+  """
+    The one-line report for an exception raised reading, lexing or
+    parsing a file. Whatever went wrong (a syntax error, a missing file,
+    undecodable text, nesting too deep...) is that file's problem, not
+    the whole run's.
+    """
+  if isinstance(e, ParserError):
+    return ' '.join(str(e).split('\n'))
+  elif isinstance(e, OSError):
+    return str(e)
+  return f"{type(e).__name__}: {e}"
+
+
+def parse_file(path):
+  """
+    Lex and parse one file.
+    Returns (ok, diagnostic).
+    """
+  try:
+    with open(path) as f:
+      Parser(Lexer(f)).parse()
+  except Exception as e:
+    return False, diagnostic(e)
+  return True, ''
+
+
+def parse_files(paths, jobs=None, threads=False):
+  """
+    Parse all the paths in a process pool, or a thread pool if threads
+    is true.
+    Yields (path, ok, diagnostic) in the same order as paths.
+    """
+  def size(path):
+    try:
+      return os.path.getsize(path)
+    except OSError:
+      return 0
+
+  executor = ThreadPoolExecutor if threads else ProcessPoolExecutor
+  with executor(max_workers=jobs or available_cores()) as pool:
+    futures = [None] * len(paths)
+    # submit biggest first, but keep track of where each one goes
+    for i in sorted(range(len(paths)), key=lambda i: size(paths[i]),
+                    reverse=True):
+      futures[i] = pool.submit(parse_file, paths[i])
+
+    for path, future in zip(paths, futures):
+      ok, diagnostic = future.result()
+      yield path, ok, diagnostic
+
+
+def main(argv=None):
+  ap = argparse.ArgumentParser(description='Lex and parse FunLang files.')
+  ap.add_argument('-j', '--jobs', type=int, default=None,
+                  help='number of workers (default: all cores)')
+  ap.add_argument('--threads', action='store_true',
+                  help='use threads instead of processes')
+  ap.add_argument('files', nargs='+', help='files or glob patterns')
+  args = ap.parse_args(argv)
+
+  failed = 0
+  for path, ok, diagnostic in parse_files(expand(args.files), args.jobs,
+                                          args.threads):
+    if ok:
+      print(f"{path}: ok")
+    else:
+      failed += 1
+      print(f"{path}: {diagnostic}")
+    sys.stdout.flush()
+
+  return 1 if failed else 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,98 @@
+"""
+Startup import report for the lexer and parser entry points.
+
+Runs each entry point (parser_start.py and lexer/lexer.py) under
+python -X importtime with empty input, and reports how long its imports
+took in all, and which modules cost the most, best of --repeat runs. An
+entry point fails if it imports any module in --forbid; by default the
+ones that were taken out of startup (enum, re, pdb) and must not creep
+back in.
+
+    python importtime.py [--top N] [--repeat N] [--forbid MODULE...]
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+ENTRY_POINTS = (
+  os.path.join(HERE, 'parser_start.py'),
+  os.path.join(HERE, os.pardir, 'lexer', 'lexer.py'),
+)
+
+FORBIDDEN = ('enum', 're', 'pdb')
+
+
+def import_times(path):
+  """
+    Run the script at path under -X importtime.
+    Returns [(module, depth, self us, cumulative us)...] in import order.
+    """
+  run = subprocess.run([sys.executable, '-X', 'importtime', path],
+                       stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                       stderr=subprocess.PIPE, text=True,
+                       cwd=os.path.dirname(path))
+  modules = []
+  for line in run.stderr.splitlines():
+    if not line.startswith('import time:'):
+      continue
+    own, cumulative, name = line[len('import time:'):].split('|')
+    if not own.strip().isdigit():
+      # the column headings
+      continue
+    name = name[1:]
+    depth = (len(name) - len(name.lstrip())) // 2
+    modules.append((name.strip(), depth, int(own), int(cumulative)))
+  return modules
+
+
+def report(path, top=10, repeat=3, forbid=FORBIDDEN):
+  """
+    Import report for one entry point.
+    Returns (total us, [(module, self us, cumulative us)...] costliest
+    first, [forbidden modules imported]).
+    """
+  runs = [import_times(path) for _ in range(repeat)]
+  best = min(runs, key=lambda modules: sum(m[3] for m in modules
+                                           if m[1] == 0))
+  total = sum(m[3] for m in best if m[1] == 0)
+  costliest = sorted(best, key=lambda m: m[3], reverse=True)[:top]
+  imported = {m[0] for m in best}
+  return (total, [(name, own, cumulative)
+                  for name, _, own, cumulative in costliest],
+          [name for name in forbid if name in imported])
+
+
+def main(argv=None):
+  ap = argparse.ArgumentParser(
+    description='Report what the lexer and parser import at startup.')
+  ap.add_argument('--top', type=int, default=10,
+                  help='number of modules to list (default: 10)')
+  ap.add_argument('--repeat', type=int, default=3,
+                  help='runs per entry point, the best is kept (default: 3)')
+  ap.add_argument('--forbid', nargs='*', default=FORBIDDEN, metavar='MODULE',
+                  help=f"modules that must not be imported "
+                       f"(default: {' '.join(FORBIDDEN)})")
+  args = ap.parse_args(argv)
+
+  failed = 0
+  for path in ENTRY_POINTS:
+    total, costliest, forbidden = report(path, args.top, args.repeat,
+                                         args.forbid)
+    name = os.path.relpath(path, os.path.join(HERE, os.pardir))
+    print(f"{name}: imports took {total / 1000:.3f} ms")
+    print(f"  {'cumulative ms':>13} {'self ms':>9}  module")
+    for module, own, cumulative in costliest:
+      print(f"  {cumulative / 1000:13.3f} {own / 1000:9.3f}  {module}")
+    if forbidden:
+      failed += 1
+      print(f"  FAIL imports {', '.join(forbidden)}")
+    sys.stdout.flush()
+
+  return 1 if failed else 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,176 @@
+"""
+Resource limits for running FunLang programs.
+
+Limits says how much a program may use. Budget tracks one run against
+them, and raises LimitExceeded as soon as a limit is passed:
+
+    budget = Budget(limits)
+    budget.check_arrays(tree)        # before running anything
+    ...
+    budget.step()                    # once per statement (or loop pass)
+    with budget.call(token):         # around every PROC/function call
+      ...
+
+step() only counts down; the step total and the clock are checked once
+every check_every steps, so a step costs one subtraction and compare.
+The step limit is still exact, and the deadline is overrun by at most
+check_every steps.
+
+A Budget belongs to one run. Nothing is kept anywhere else, so once a
+program has hit a limit the engine can start the next one with a fresh
+Budget (the same Limits can be shared by any number of them).
+"""
+import time
+from runtime_io import declared_size
+
+# roughly what one array element costs: a slot in a list
+ELEMENT_BYTES = 8
+
+
+class LimitExceeded(Exception):
+  """
+    A run went over one of its limits.
+    limit is which one ('steps', 'seconds', 'call_depth' or
+    'array_bytes'), used how much was asked for and allowed the limit.
+    token is where it happened, if known.
+    """
+
+  def __init__(self, limit, used, allowed, token=None):
+    where = f" at line {token.line}, column {token.col}" if token else ''
+    super().__init__(f"{limit} limit of {allowed} exceeded{where} "
+                     f"(needed {used})")
+    self.limit = limit
+    self.used = used
+    self.allowed = allowed
+    self.token = token
+
+
+class Limits:
+  """
+    How much a run may use. None means no limit. A limit below zero, or
+    check_every below 1 (which would never count a step), is a
+    ValueError rather than quietly letting everything through.
+    """
+  __slots__ = ('steps', 'seconds', 'call_depth', 'array_bytes',
+               'check_every')
+
+  def __init__(self, steps=None, seconds=None, call_depth=None,
+               array_bytes=None, check_every=1024):
+    for name, value in (('steps', steps), ('seconds', seconds),
+                        ('call_depth', call_depth),
+                        ('array_bytes', array_bytes)):
+      if value is not None and value < 0:
+        raise ValueError(f"{name} limit can't be negative, got {value}")
+    if check_every < 1:
+      raise ValueError(f"check_every must be at least 1, got {check_every}")
+
+    self.steps = steps
+    self.seconds = seconds
+    self.call_depth = call_depth
+    self.array_bytes = array_bytes
+    self.check_every = check_every
+
+
+class Budget:
+  """
+    What one run has used so far. The clock starts when it is made.
+    """
+
+  def __init__(self, limits):
+    self.limits = limits
+    self.steps = 0
+    self.depth = 0
+    self.array_bytes = 0
+    self.__start = time.monotonic()
+    self.__left = self.__batch()
+
+  def __batch(self):
+    #How many steps can go by before the next check
+    batch = self.limits.check_every
+    if self.limits.steps is not None:
+      batch = min(batch, self.limits.steps - self.steps)
+    return batch
+
+  def step(self, token=None):
+    """
+        Count one step of the program.
+        """
+    self.__left -= 1
+    if self.__left < 0:
+      self.__check(token)
+
+  def __check(self, token):
+    self.steps += self.__batch()
+    if self.limits.steps is not None and self.steps >= self.limits.steps:
+      raise LimitExceeded('steps', self.steps + 1, self.limits.steps, token)
+    if self.limits.seconds is not None:
+      elapsed = time.monotonic() - self.__start
+      if elapsed > self.limits.seconds:
+        raise LimitExceeded('seconds', round(elapsed, 3), self.limits.seconds,
+                            token)
+    # this step is the first of the new batch
+    self.__left = self.__batch() - 1
+
+  def used_steps(self):
+    """
+        Steps taken so far.
+        """
+    return self.steps + self.__batch() - self.__left
+
+  def call(self, token=None):
+    """
+        Context manager for one call, counting it against call_depth.
+        """
+    return _Call(self, token)
+
+  def allocate(self, nbytes, token=None):
+    """
+        Count nbytes more array memory, when an engine creates an array.
+        """
+    self.array_bytes += nbytes
+    if (self.limits.array_bytes is not None and
+        self.array_bytes > self.limits.array_bytes):
+      used = self.array_bytes
+      self.array_bytes -= nbytes
+      raise LimitExceeded('array_bytes', used, self.limits.array_bytes, token)
+
+  def free(self, nbytes):
+    self.array_bytes -= nbytes
+
+  def check_arrays(self, tree):
+    """
+        Check, before the program runs, that the arrays it declares fit in
+        array_bytes. Each declaration is counted once; an engine that
+        makes a new array for every call should also use allocate().
+        """
+    if self.limits.array_bytes is None:
+      return
+
+    total = 0
+    stack = [tree]
+    while stack:
+      node = stack.pop()
+      if node.kind == 'decl' and len(node.children) > 1:
+        total += declared_size(node) * ELEMENT_BYTES
+        if total > self.limits.array_bytes:
+          raise LimitExceeded('array_bytes', total, self.limits.array_bytes,
+                              node.token)
+      stack.extend(node.children)
+
+
+class _Call:
+
+  def __init__(self, budget, token):
+    self.budget = budget
+    self.token = token
+
+  def __enter__(self):
+    budget = self.budget
+    budget.depth += 1
+    limit = budget.limits.call_depth
+    if limit is not None and budget.depth > limit:
+      budget.depth -= 1
+      raise LimitExceeded('call_depth', budget.depth + 1, limit, self.token)
+
+  def __exit__(self, *exc):
+    self.budget.depth -= 1
@@ -0,0 +1,162 @@
+"""
+Memory profile of lexing and parsing one file.
+
+Runs the lexer over the file keeping every token, then parses it into a
+tree, with tracemalloc watching both. Prints one JSON object:
+
+    {
+      "file": ..., "bytes": size of the source,
+      "lex": {"tokens": n, "bytes": held by the tokens,
+              "bytes_per_token": ..., "peak": ...},
+      "parse": {"nodes": n, "bytes": held by the tree (tokens included),
+                "bytes_per_node": ..., "peak": ...},
+      "max_rss": peak resident memory of the process, in bytes,
+      "sites": [{"file": ..., "line": ..., "bytes": ..., "count": ...}, ...]
+    }
+
+If the file has a syntax error the JSON object is instead
+
+    {"file": ..., "error": the parser's message, "line": ..., "col": ...}
+
+and the exit status is non-zero.
+
+"bytes" are what is still held once the step is done, "peak" the most
+traced at any one time during it. "sites" are the lines in lexer.py and
+parser_start.py holding the most memory at the end of the parse.
+tracemalloc slows everything down a lot, so time nothing with this on.
+
+    python memprofile.py [--top N] FILE
+"""
+import io
+import os
+import sys
+import json
+import argparse
+import tracemalloc
+import lexer
+import parser_start
+from lexer import Token, Lexer
+from parser_start import Parser, ParserError
+
+try:
+  import resource
+except ImportError:
+  resource = None
+
+
+def max_rss():
+  """
+    Peak resident memory of this process in bytes, or None if the
+    platform can't say.
+    """
+  if resource is None:
+    return None
+  rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # kilobytes everywhere except macOS
+  return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def count_nodes(node):
+  count = 0
+  stack = [node]
+  while stack:
+    node = stack.pop()
+    count += 1
+    stack.extend(node.children)
+  return count
+
+
+def measure(fn):
+  """
+    Run fn with tracemalloc on.
+    Returns (fn's result, bytes still held, peak bytes, snapshot).
+    """
+  tracemalloc.start()
+  try:
+    before = tracemalloc.get_traced_memory()[0]
+    result = fn()
+    held, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+  finally:
+    tracemalloc.stop()
+  return result, held - before, peak - before, snapshot
+
+
+def profile(text, top=10):
+  """
+    Profile lexing and parsing text.
+    Returns the report as a dict.
+    """
+  def lex():
+    lx = Lexer(io.StringIO(text))
+    tokens = []
+    while lx.next().token != Token.EOF:
+      tokens.append(lx.get_tok())
+    return tokens
+
+  def parse():
+    return Parser(Lexer(io.StringIO(text))).parse()
+
+  tokens, lex_bytes, lex_peak, _ = measure(lex)
+  count = len(tokens)
+  del tokens
+
+  tree, parse_bytes, parse_peak, snapshot = measure(parse)
+  nodes = count_nodes(tree)
+  del tree
+
+  snapshot = snapshot.filter_traces([
+    tracemalloc.Filter(True, lexer.__file__),
+    tracemalloc.Filter(True, parser_start.__file__),
+  ])
+  sites = [{
+    'file': os.path.basename(stat.traceback[0].filename),
+    'line': stat.traceback[0].lineno,
+    'bytes': stat.size,
+    'count': stat.count,
+  } for stat in snapshot.statistics('lineno')[:top]]
+
+  return {
+    'bytes': len(text),
+    'lex': {
+      'tokens': count,
+      'bytes': lex_bytes,
+      'bytes_per_token': round(lex_bytes / count, 1) if count else None,
+      'peak': lex_peak,
+    },
+    'parse': {
+      'nodes': nodes,
+      'bytes': parse_bytes,
+      'bytes_per_node': round(parse_bytes / nodes, 1),
+      'peak': parse_peak,
+    },
+    'max_rss': max_rss(),
+    'sites': sites,
+  }
+
+
+def main(argv=None):
+  ap = argparse.ArgumentParser(
+    description='Report the memory used lexing and parsing a FunLang file.')
+  ap.add_argument('--top', type=int, default=10,
+                  help='number of allocation sites to list (default: 10)')
+  ap.add_argument('file')
+  args = ap.parse_args(argv)
+
+  with open(args.file) as f:
+    text = f.read()
+
+  try:
+    report = profile(text, args.top)
+  except ParserError as e:
+    # still JSON, so whatever reads the output can tell what went wrong
+    print(json.dumps({'file': args.file, 'error': str(e),
+                      'line': e.token.line, 'col': e.token.col}, indent=2))
+    return -1
+
+  print(json.dumps(dict(file=args.file, **report), indent=2))
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,367 @@
+"""
+Loop-invariant code motion and common subexpression elimination.
+
+Optimizer works on the parse tree Parser.parse() builds and returns a
+new tree; the one it is given is left alone. In every block:
+
+  * An arithmetic expression in a WHILE loop (condition or body) that
+    reads no variable the loop writes is worked out once, into a new
+    variable, just before the loop.
+  * An expression that comes up more than once in the block's statements
+    is worked out once, before the first statement that uses it, as long
+    as nothing it reads is written in between.
+
+What a statement writes is read off the tree: an assignment or swap
+writes its target(s), READ writes everything it reads into, and a
+declaration starts a new variable. A call could write anything, so a
+loop with a call in it is left alone, and a call in a block ends every
+reuse that was running.
+
+A loop can run zero times, so only +, - and * are hoisted out of loops.
+/ and ** can fail, and so can an array read with an out of range
+subscript; hoisting them would run them when the program wouldn't have.
+The subscripts themselves can still be hoisted. Within a block the first
+use runs anyway, so /, ** and array reads are all reused there.
+
+New variables are named _t1, _t2, ..., skipping any name the program
+already uses. They are declared NUMBER, except one holding an array read,
+which gets the array's declared type (a CHARLIT array's element is a
+CHARLIT). An array read is not reused if its name is declared with
+different types in different places, as the right one can't be told
+from the name. Each change is reported as a line of
+text in Optimizer.changes.
+
+    python optimize.py FILE
+"""
+import sys
+from lexer import Token, TokenDetail, LineIndex, Lexer
+from parser_start import Node, Parser, ParserError
+
+# operators that can't fail, so they are safe to run before a loop that
+# might not run at all
+HOISTABLE = (Token.PLUS, Token.MINUS, Token.TIMES)
+
+PRECEDENCE = {Token.PLUS: 1, Token.MINUS: 1, Token.TIMES: 2, Token.DIV: 2,
+              Token.EXP: 3}
+
+EXPRESSIONS = ('binop', 'var', 'literal', 'ref', 'call')
+
+
+def source(node):
+  """
+    Turn an expression back into FunLang source, for reports.
+    """
+  if node.kind == 'binop':
+    op = node.token.token
+    left, right = node.children
+    text = [source(left), source(right)]
+    # ** groups to the right, everything else to the left
+    if left.kind == 'binop' and (PRECEDENCE[left.token.token] < PRECEDENCE[op]
+                                 or op == Token.EXP and
+                                 left.token.token == Token.EXP):
+      text[0] = f"({text[0]})"
+    if right.kind == 'binop' and (PRECEDENCE[right.token.token] < PRECEDENCE[op]
+                                  or op != Token.EXP and
+                                  PRECEDENCE[right.token.token] == PRECEDENCE[op]):
+      text[1] = f"({text[1]})"
+    return f"{text[0]} {node.token.lexeme} {text[1]}"
+  elif node.kind == 'ref' and node.children:
+    return f"{node.token.lexeme}[{', '.join(map(source, node.children))}]"
+  elif node.kind == 'call':
+    return f"{node.token.lexeme}({', '.join(map(source, node.children))})"
+  elif node.token.token == Token.STRING:
+    return f'"{node.token.lexeme}"'
+  elif node.token.token == Token.CHARLIT:
+    return f"'{node.token.lexeme}'"
+  return node.token.lexeme
+
+
+def _key(node):
+  #Two expressions with the same key always work out the same value
+  return (node.kind, node.token.token.name, node.token.lexeme,
+          tuple(_key(c) for c in node.children))
+
+
+def _first(node):
+  #The token an expression starts at
+  while node.kind == 'binop':
+    node = node.children[0]
+  return node.token
+
+
+def _subtree(node):
+  yield node
+  for child in node.children:
+    yield from _subtree(child)
+
+
+def _reads(node):
+  return {n.token.lexeme for n in _subtree(node) if n.kind in ('var', 'ref')}
+
+
+def _copy(node):
+  return Node(node.kind, node.token, [_copy(c) for c in node.children])
+
+
+def _effects(node, writes):
+  """
+    Add the names node writes when it runs to writes.
+    Returns False if it might write anything at all (it makes a call).
+    """
+  if node.kind in ('proc', 'fun'):
+    # a definition doesn't run anything
+    return True
+  elif node.kind == 'call':
+    return False
+  elif node.kind in ('assign', 'swap', 'decl'):
+    writes.add(node.token.lexeme)
+    if node.kind == 'swap':
+      writes.add(node.children[-1].token.lexeme)
+  elif node.kind == 'read':
+    writes.update(ref.token.lexeme for ref in node.children)
+
+  return all(_effects(c, writes) for c in node.children)
+
+
+class Optimizer:
+  """
+    Hoists loop invariants and reuses common subexpressions.
+    """
+
+  def __init__(self):
+    self.changes = []
+    self.__used = set()
+    self.__temps = 0
+    #the type token kind each name is declared with, None if more than one
+    self.__declared = {}
+    #names of the variables hoisted out of loops so far
+    self.__hoisted = set()
+
+  def optimize(self, tree):
+    """
+        Optimize a 'program' tree.
+        Returns the new tree.
+        """
+    tree = _copy(tree)
+    self.__used.update(n.token.lexeme for n in _subtree(tree)
+                       if n.token is not None
+                       and n.token.token == Token.VARIABLE)
+    for n in _subtree(tree):
+      if n.kind in ('decl', 'param'):
+        kind = n.children[0].token.token
+        name = n.token.lexeme
+        if self.__declared.get(name, kind) != kind:
+          kind = None
+        self.__declared[name] = kind
+    self.__nested(tree)
+    return tree
+
+  def __nested(self, node):
+    #Optimize every block directly under node
+    for child in node.children:
+      if child.kind == 'block':
+        self.__block(child)
+      elif child.kind in ('proc', 'fun', 'if', 'while'):
+        self.__nested(child)
+
+  def __block(self, block):
+    # inner blocks first, so what they hoist can be hoisted again
+    for stmt in block.children:
+      if stmt.kind == 'block':
+        self.__block(stmt)
+      else:
+        self.__nested(stmt)
+
+    i = 0
+    while i < len(block.children):
+      if block.children[i].kind == 'while':
+        i += self.__hoist(block, i)
+      i += 1
+
+    self.__reuse(block)
+
+  def __temp(self, at, kind=Token.NUMTYPE):
+    #A new variable of type kind (NUMTYPE or CHARTYPE), and a
+    #declaration for it
+    self.__temps += 1
+    while f"_t{self.__temps}" in self.__used:
+      self.__temps += 1
+    name = f"_t{self.__temps}"
+
+    line, col = at.line, at.col
+    where = LineIndex((), line, -col)
+    var = TokenDetail(Token.VARIABLE, name, 0, len(name), where)
+    keyword = 'NUMBER' if kind == Token.NUMTYPE else 'CHARLIT'
+    type_tok = TokenDetail(kind, keyword, 0, len(keyword), where)
+    return var, Node('decl', var, [Node('type', type_tok)])
+
+  def __report(self, what, expr, loop, var, uses=1):
+    at = _first(expr)
+    where = f" out of the WHILE at line {loop.token.line}" if loop else ''
+    count = f" ({uses} uses)" if uses > 1 else ''
+    self.changes.append(f"line {at.line}, column {at.col}: {what} "
+                        f"{source(expr)}{where} into {var.lexeme}{count}")
+
+  def __hoist(self, block, index):
+    """
+        Move the invariant expressions of the WHILE at block.children[index]
+        to just before it.
+        Returns how many statements were put in.
+        """
+    loop = block.children[index]
+    writes = set()
+    if not _effects(loop, writes):
+      return 0
+
+    def invariant(node):
+      if node.kind == 'literal':
+        return True
+      elif node.kind == 'var':
+        return node.token.lexeme not in writes
+      return (node.kind == 'binop' and node.token.token in HOISTABLE and
+              all(map(invariant, node.children)))
+
+    # something already hoisted out of an inner loop can move out whole,
+    # rather than into yet another variable
+    added = []
+    body = loop.children[1].children
+    i = 0
+    while i + 1 < len(body):
+      decl, assign = body[i], body[i + 1]
+      name = decl.token.lexeme
+      if (decl.kind == 'decl' and name in self.__hoisted and
+          invariant(assign.children[0])):
+        del body[i:i + 2]
+        writes.discard(name)
+        added += [decl, assign]
+        self.__report('hoisted', assign.children[0], loop, decl.token)
+      else:
+        i += 1
+
+    found = {}
+
+    def visit(parent):
+      for i, node in enumerate(parent.children):
+        if node.kind == 'binop' and invariant(node):
+          found.setdefault(_key(node), []).append((parent, i))
+        elif node.kind not in ('proc', 'fun'):
+          visit(node)
+
+    visit(loop)
+
+    for uses in found.values():
+      parent, i = uses[0]
+      expr = parent.children[i]
+      var, decl = self.__temp(loop.token)
+      self.__hoisted.add(var.lexeme)
+      for parent, i in uses:
+        parent.children[i] = Node('var', var)
+      added += [decl, Node('assign', var, [expr])]
+      self.__report('hoisted', expr, loop, var, len(uses))
+
+    block.children[index:index] = added
+    return len(added)
+
+  def __reuse(self, block):
+    """
+        Work out expressions repeated across block's statements just once.
+        """
+    running = {}
+    #name -> keys of the running expressions that read it
+    readers = {}
+    done = []
+
+    def stop(names=None):
+      if names is None:
+        done.extend(running.values())
+        running.clear()
+        readers.clear()
+        return
+
+      for name in names:
+        for key in readers.pop(name, ()):
+          if key in running:
+            done.append(running.pop(key))
+
+    def collect(parent, i, where):
+      node = parent.children[i]
+      if node.kind == 'binop' or (node.kind == 'ref' and
+                                  self.__declared.get(node.token.lexeme)):
+        key = _key(node)
+        if key not in running:
+          running[key] = []
+          for name in _reads(node):
+            readers.setdefault(name, []).append(key)
+        running[key].append((parent, i, node, where))
+      for j in range(len(node.children)):
+        collect(node, j, where)
+
+    for where, stmt in enumerate(block.children):
+      writes = set()
+      if not _effects(stmt, writes):
+        stop()
+        continue
+
+      # the expressions the statement itself works out, each run once
+      if stmt.kind in EXPRESSIONS:
+        collect(block, where, where)
+      elif stmt.kind in ('assign', 'print'):
+        for i in range(len(stmt.children)):
+          collect(stmt, i, where)
+      elif stmt.kind == 'if':
+        collect(stmt, 0, where)
+
+      # reads in a statement happen before its writes
+      stop(writes)
+
+    stop()
+
+    # biggest first, and anything inside an expression already replaced
+    # is gone
+    done.sort(key=lambda uses: -sum(1 for _ in _subtree(uses[0][2])))
+    gone = set()
+    added = []
+    for uses in done:
+      uses = [use for use in uses if id(use[2]) not in gone]
+      if len(uses) < 2:
+        continue
+
+      expr = uses[0][2]
+      kind = (self.__declared[expr.token.lexeme] if expr.kind == 'ref' else
+              Token.NUMTYPE)
+      var, decl = self.__temp(_first(expr), kind)
+      for parent, i, node, where in uses:
+        gone.update(id(n) for n in _subtree(node))
+        parent.children[i] = Node('var', var)
+      added.append((uses[0][3], [decl, Node('assign', var, [expr])]))
+
+      self.__report('reused', expr, None, var, len(uses))
+
+    # statements go in back to front so the positions stay right
+    for where, stmts in sorted(added, key=lambda a: a[0], reverse=True):
+      block.children[where:where] = stmts
+
+
+def optimize(tree):
+  """
+    Optimize a 'program' tree.
+    Returns (new tree, list of changes).
+    """
+  optimizer = Optimizer()
+  return optimizer.optimize(tree), optimizer.changes
+
+
+if __name__ == "__main__":
+  if len(sys.argv) != 2:
+    print("usage: python optimize.py FILE")
+    sys.exit(2)
+
+  try:
+    with open(sys.argv[1]) as f:
+      tree = Parser(Lexer(f)).parse()
+  except ParserError as e:
+    print(e)
+    sys.exit(-1)
+
+  for change in optimize(tree)[1]:
+    print(change)
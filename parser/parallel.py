@@ -0,0 +1,158 @@
+"""
+Parallel parsing of one program.
+
+The top-level PROC, function and variable declarations of a program are
+independent, so they can be parsed at the same time. parse_parallel()
+does a quick pre-scan of the source to find where each top-level
+declaration starts. It then lexes and parses each one, and the main
+block, in a process pool, and puts the subtrees back together into the
+same 'program' tree Parser.parse() would build. Positions are right
+because each worker's lexer is started at the line and column its slice
+begins at.
+
+With threads=True (--threads) the slices are parsed in a thread pool
+instead. The subtrees then don't have to be pickled back, but threads
+only run in parallel on a free-threaded CPython build.
+
+If anything about a slice doesn't parse cleanly (a syntax error, or a
+slice that doesn't hold exactly one declaration) the whole file is
+parsed again serially. Errors, and the results in general, are then
+exactly the ones Parser gives.
+
+    python parallel.py [-j JOBS] [--threads] FILE
+"""
+import io
+import re
+import sys
+import argparse
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from lexer import Token, Lexer
+from parser_start import Node, Parser, ParserError
+from batch import available_cores
+
+# Just enough of the lexer to find the top-level declarations: comments
+# and literals (so nothing inside them is looked at), words, and brackets.
+PRESCAN = re.compile(r'#[^\n]*|"[^"]*"?|\'[^\']*\'?|[^\W\d]\w*|[()]')
+SPACE_AND_COMMENTS = re.compile(r'(?:\s|#[^\n]*)*')
+
+STARTERS = ('PROC', 'NUMBER', 'CHARLIT')
+
+# below this many declarations a process pool costs more than it saves
+MIN_DECLARATIONS = 8
+
+
+def prescan(text):
+  """
+    Find where each top-level declaration and the main block start.
+    Returns their offsets, with the main block's last, or None if the
+    source doesn't look like declarations followed by a main block.
+    """
+  first = SPACE_AND_COMMENTS.match(text).end()
+  starts = []
+  depth = 0
+  parens = 0
+  # a top-level parameter list was just closed, so the next BEGIN is the
+  # function's body rather than the main block
+  body_next = False
+  for m in PRESCAN.finditer(text, first):
+    word = m.group()
+    if word == 'BEGIN':
+      if depth == 0 and not body_next:
+        starts.append(m.start())
+        return starts if starts[0] == first else None
+      depth += 1
+      body_next = False
+    elif word == 'END':
+      depth -= 1
+    elif word == '(':
+      parens += 1
+    elif word == ')':
+      parens -= 1
+      body_next = depth == 0 and parens == 0
+    elif word in STARTERS and depth == 0 and parens == 0:
+      starts.append(m.start())
+
+  return None
+
+
+def spans(text, starts):
+  """
+    Cut text at the offsets in starts.
+    Yields (slice, line, col) with the position each slice starts at.
+    """
+  line = 1
+  prev = 0
+  for i, start in enumerate(starts):
+    line += text.count('\n', prev, start)
+    col = start - text.rfind('\n', 0, start)
+    end = starts[i + 1] if i + 1 < len(starts) else len(text)
+    yield text[start:end], line, col
+    prev = start
+
+
+def parse_span(span):
+  """
+    Parse the one declaration (or the main block) in a slice.
+    Returns its subtree, or None if the slice didn't parse the way it
+    would have in the middle of the whole program.
+    """
+  text, line, col = span
+  lexer = Lexer(io.StringIO(text), line, col)
+  try:
+    node = next(Parser(lexer).declarations())
+  except ParserError:
+    return None
+
+  # the main block runs to the end of the file, anything else has to
+  # have used up its whole slice
+  if node.kind != 'block' and lexer.get_tok().token != Token.EOF:
+    return None
+  return node
+
+
+def parse_parallel(text, jobs=None, threads=False):
+  """
+    Parse a whole program held in text, in parallel where it can, with
+    processes or (if threads is true) threads.
+    Returns the same tree as Parser.parse(), or raises the same
+    ParserError.
+    """
+  jobs = jobs or available_cores()
+  starts = prescan(text)
+  if starts is None or len(starts) - 1 < MIN_DECLARATIONS or jobs < 2:
+    return Parser(Lexer(io.StringIO(text))).parse()
+
+  executor = ThreadPoolExecutor if threads else ProcessPoolExecutor
+  with executor(max_workers=jobs) as pool:
+    chunksize = max(1, len(starts) // (jobs * 4))
+    nodes = list(pool.map(parse_span, spans(text, starts), chunksize=chunksize))
+
+  if None in nodes or nodes[-1].kind != 'block':
+    # let the serial parser have it, so errors come out the same
+    return Parser(Lexer(io.StringIO(text))).parse()
+
+  return Node('program', None, nodes)
+
+
+def main(argv=None):
+  ap = argparse.ArgumentParser(description='Parse a FunLang file in parallel.')
+  ap.add_argument('-j', '--jobs', type=int, default=None,
+                  help='number of workers (default: all cores)')
+  ap.add_argument('--threads', action='store_true',
+                  help='use threads instead of processes')
+  ap.add_argument('file')
+  args = ap.parse_args(argv)
+
+  with open(args.file) as f:
+    text = f.read()
+
+  try:
+    parse_parallel(text, args.jobs, args.threads)
+  except ParserError as e:
+    print(e)
+    return -1
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
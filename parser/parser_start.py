@@ -9,16 +9,55 @@ To write a parser:
     3.) Add data structures to build the parse tree.
 """
 import sys
-import pdb
 from lexer import Token, Lexer
 
 
+class ParserError(Exception):
+  """
+    A syntax error. token is the token parsing stopped at.
+    """
+
+  def __init__(self, message, token):
+    super().__init__(message)
+    self.token = token
+
+
+class Node:
+  """
+    A parse tree node.
+    kind says what the node is (see PARSE TREE in Parser), token is the
+    token it was built around (a name, an operator, a literal...) and
+    children are its sub-nodes in source order.
+    """
+  __slots__ = ('kind', 'token', 'children')
+
+  def __init__(self, kind, token=None, children=()):
+    self.kind = kind
+    self.token = token
+    self.children = children
+
+  def __eq__(self, other):
+    if not isinstance(other, Node):
+      return NotImplemented
+    return (self.kind, self.token,
+            list(self.children)) == (other.kind, other.token,
+                                     list(other.children))
+
+  __hash__ = None
+
+  def __reduce__(self):
+    return (Node, (self.kind, self.token, self.children))
+
+  def __repr__(self):
+    return f"Node({self.kind!r}, {self.token!r}, {list(self.children)!r})"
+
+
 class Parser:
   """
     Parser state will follow the lexer state.
     We consume the stream token by token.
     Match our tokens, if no match is possible, 
-    print an error and stop parsing.
+    raise a ParserError and stop parsing.
     """
 
   def __init__(self, lexer):
@@ -37,21 +76,27 @@ class Parser:
     ct = self.__lexer.get_tok()
     return ct.token == t
 
+  def __take(self):
+    """
+        Return the current token and advance past it.
+        """
+    ct = self.__lexer.get_tok()
+    self.__next()
+    return ct
+
   def __must_be(self, t):
     """
         Return true if t matches the current token.
-        Otherwise, we print an error message and
-        exit.
+        Otherwise, we raise a ParserError.
         """
     if self.__has(t):
       return True
 
-    # print an error
+    # report an error
     ct = self.__lexer.get_tok()
-    print(
-      f"Parser error at line {ct.line}, column {ct.col}.\nReceived token {ct.token.name} expected {t.name}"
-    )
-    sys.exit(-1)
+    raise ParserError(
+      f"Parser error at line {ct.line}, column {ct.col}.\nReceived token {ct.token.name} expected {t.name}",
+      ct)
 
   '''
   I added this function to make sure that there is no unexpected EOF before
@@ -61,22 +106,43 @@ class Parser:
   def __must_not_be(self, t):
     if self.__has(t):
       ct = self.__lexer.get_tok()
-      print(
-        f"Parser error at line {ct.line}, column {ct.col}.\nForbidden token {ct.token.name}"
-      )
-      sys.exit(-1)
+      raise ParserError(
+        f"Parser error at line {ct.line}, column {ct.col}.\nForbidden token {ct.token.name}",
+        ct)
 
     # print an error
 
-  def __print_current_token(self):
-    ct = self.__lexer.get_tok()
-    print(f"{ct}")
-
   def parse(self):
     """
         Attempt to parse a program.
+        Returns its parse tree.
+        """
+    return Node('program', None, list(self.declarations()))
+
+  def declarations(self):
+    """
+        Parse a program one top-level declaration at a time.
+
+        Each PROC, function or variable declaration before the main block
+        is yielded as soon as it has been parsed, and the main block comes
+        last. The parser keeps nothing once it has been yielded, so a
+        caller that drops each subtree when done with it parses in memory
+        bounded by the largest declaration, not the whole file. A syntax
+        error is raised as ParserError after everything before it has
+        been yielded. So is nesting too deep for Python's recursion
+        limit.
         """
-    self.__program()
+    try:
+      self.__next()
+      while not self.__has(Token.BEGIN):
+        yield self.__top_level()
+
+      yield self.__block()
+    except RecursionError:
+      ct = self.__lexer.get_tok()
+      raise ParserError(
+        f"Parser error at line {ct.line}, column {ct.col}.\nNested too deeply",
+        ct) from None
 
   '''
     TOKEN LIST:
@@ -117,118 +183,143 @@ class Parser:
     STRING
     VARIABLE
     #################
-    '''
 
-  def __program(self):
-    self.__next()
-    while not self.__has(Token.BEGIN):
-      if self.__has(Token.PROC):
-        self.__next()
-        self.__fun()
-        self.__next()
-      elif self.__has(Token.NUMTYPE):
-        self.__next()
-        self.__fun_or_decl()
-        self.__next()
-      else:
-        self.__must_be(Token.CHARTYPE)
-        self.__next()
-        self.__fun_or_decl()
-        self.__next()
+    PARSE TREE:
+    ###########
+    kind       token               children
+    program    -                   top-level decls..., main block
+    proc       name                param..., block
+    fun        name                type, param..., block
+    decl       name                type, bound literal...
+    param      name                type
+    type       NUMTYPE/CHARTYPE    -
+    block      BEGIN               statement...
+    assign     name                [subscript expr...,] expr
+    swap       name                [subscript expr...,] ref
+    if         IF                  cond, block, [else block]
+    while      WHILE               cond, block
+    print      PRINT               expr...
+    read       READ                ref...
+    ref        name                subscript expr...
+                                   (a plain name in an expression is a var)
+    cond       EQ/NOEQ/LT/...      expr, expr
+    binop      PLUS/MINUS/...      expr, expr
+    call       name                arg expr...
+    var        name                -
+    literal    INTLIT/FLOATLIT/    -
+               CHARLIT/STRING
+    An expression used as a statement is its own statement node.
+    #################
+    '''
 
-    self.__block()
+  def __top_level(self):
+    if self.__has(Token.PROC):
+      self.__next()
+      return self.__fun()
+    elif self.__has(Token.NUMTYPE):
+      return self.__fun_or_decl(self.__take())
+    else:
+      self.__must_be(Token.CHARTYPE)
+      return self.__fun_or_decl(self.__take())
 
   def __block(self):
     self.__must_be(Token.BEGIN)
-    self.__next()
+    begin = self.__take()
+    statements = []
     while not self.__has(Token.END):
-      self.__statement()
+      statements.append(self.__statement())
 
     self.__next()
+    return Node('block', begin, statements)
 
   def __statement(self):
     if self.__has(Token.VARIABLE):
-      self.__next()
-      self.__expr_assign_swap()
+      return self.__expr_assign_swap(self.__take())
     elif self.__has(Token.BEGIN):
-      self.__next()
-      self.__block()
+      return self.__block()
     elif self.__has(Token.NUMTYPE) or self.__has(Token.CHARTYPE):
-      self.__next()
-      self.__fun_or_decl()
+      return self.__fun_or_decl(self.__take())
     elif self.__has(Token.PROC):
       self.__next()
-      self.__fun()
+      return self.__fun()
     elif self.__has(Token.IF):
-      self.__next()
-      self.__branch()
+      return self.__branch(self.__take())
     elif self.__has(Token.WHILE):
-      self.__next()
-      self.__loop()
+      return self.__loop(self.__take())
     elif self.__has(Token.PRINT):
-      self.__next()
-      self.__arg_list()
+      return Node('print', self.__take(), self.__arg_list())
     elif self.__has(Token.READ):
-      self.__next()
-      self.__ref_list()
+      return Node('read', self.__take(), self.__ref_list())
     elif self.__has(Token.LPAREN):
       self.__next()
-      self.__expression()
+      expr = self.__expression()
       self.__must_be(Token.RPAREN)
       self.__next()
+      return expr
     elif self.__has(Token.INTLIT):
-      self.__next()
-      self.__factor2()
-      self.__term2()
-      self.__expression2()
+      left = Node('literal', self.__take())
+      return self.__expression2(self.__term2(self.__factor2(left)))
     elif self.__has(Token.FLOATLIT):
-      self.__next()
-      self.__factor2()
-      self.__term2()
-      self.__expression2()
+      left = Node('literal', self.__take())
+      return self.__expression2(self.__term2(self.__factor2(left)))
     else:
       self.__must_be(Token.READ)
       self.__read()
 
   #Decides whether a statement beginning with a variable is an expression,
   #assignment, or swap
-  def __expr_assign_swap(self):
+  def __expr_assign_swap(self, name):
+    subscripts = []
+    if self.__has(Token.LBRACK):
+      self.__next()
+      subscripts = self.__ref2()
+
     if self.__has(Token.ASSIGN):
       self.__next()
-      self.__expression()
+      return Node('assign', name, subscripts + [self.__expression()])
     elif self.__has(Token.SWAP):
       self.__next()
-      self.__swap()
+      return Node('swap', name, subscripts + [self.__swap()])
     else:
-      self.__factor2()
-      self.__term2()
-      self.__expression2()
+      if subscripts:
+        left = Node('ref', name, subscripts)
+      elif self.__has(Token.LPAREN):
+        self.__next()
+        left = self.__call(name)
+      else:
+        left = Node('var', name)
+      return self.__expression2(self.__term2(self.__factor2(left)))
 
   def __swap(self):
     self.__must_be(Token.VARIABLE)
-    self.__next()
+    name = self.__take()
+    subscripts = []
     if self.__has(Token.LBRACK):
       self.__next()
-      self.__swap2()
+      subscripts = self.__swap2()
+    return Node('ref', name, subscripts)
 
   def __swap2(self):
-    self.expression()
+    subscripts = [self.__expression()]
     if self.__has(Token.COMMA):
       self.__next()
-      self.__expression()
-    else:
-      self.__must_be(Token.RBRACK)
-      self.__next()
+      subscripts.append(self.__expression())
+    self.__must_be(Token.RBRACK)
+    self.__next()
+    return subscripts
 
-  def __fun_or_decl(self):
+  def __fun_or_decl(self, type_tok):
     self.__must_be(Token.VARIABLE)
-    self.__next()
+    name = self.__take()
+    decl_type = Node('type', type_tok)
     if self.__has(Token.LPAREN):
       self.__next()
-      self.__fun2()
+      params, block = self.__fun2()
+      return Node('fun', name, [decl_type] + params + [block])
     elif self.__has(Token.LBRACK):
       self.__next()
-      self.__bounds()
+      return Node('decl', name, [decl_type] + self.__bounds())
+    return Node('decl', name, [decl_type])
 
   def __decl(self):
     if self.__has(Token.LBRACK):
@@ -238,161 +329,178 @@ class Parser:
       self.__next()
 
   def __bounds(self):
-    self.__must_be(Token.INTLIT)
-    self.__next()
-    if self.__has(Token.COMMA):
-      self.__next()
-      self.__bounds()
-    else:
-      self.__must_be(Token.RBRACK)
+    bounds = []
+    while True:
+      self.__must_be(Token.INTLIT)
+      bounds.append(Node('literal', self.__take()))
+      if not self.__has(Token.COMMA):
+        break
       self.__next()
 
+    self.__must_be(Token.RBRACK)
+    self.__next()
+    return bounds
+
   def __fun(self):
     self.__must_be(Token.VARIABLE)
-    self.__next()
+    name = self.__take()
     self.__must_be(Token.LPAREN)
     self.__next()
-    self.__fun2()
+    params, block = self.__fun2()
+    return Node('proc', name, params + [block])
 
   def __fun2(self):
-    if self.__has(Token.NUMTYPE) or self.__has(Token.CHARTYPE):
-      self.__next()
+    """
+        Parameters, the closing paren and the body.
+        Returns (params, block).
+        """
+    params = []
+    while self.__has(Token.NUMTYPE) or self.__has(Token.CHARTYPE):
+      param_type = Node('type', self.__take())
       self.__must_be(Token.VARIABLE)
-      self.__next()
-      if self.__has(Token.RPAREN):
-        self.__next()
-      else:
+      params.append(Node('param', self.__take(), [param_type]))
+      if not self.__has(Token.RPAREN):
         self.__must_be(Token.COMMA)
-        self.__fun2()
-    else:
-      self.__must_be(Token.RPAREN)
-      self.__next()
-      self.__block()
+        self.__next()
 
-  def __branch(self):
-    self.__condition()
-    self.__block()
-    self.__branch2()
+    self.__must_be(Token.RPAREN)
+    self.__next()
+    return params, self.__block()
+
+  def __branch(self, if_tok):
+    cond = self.__condition()
+    block = self.__block()
+    return Node('if', if_tok, [cond, block] + self.__branch2())
 
   def __branch2(self):
     if self.__has(Token.ELSE):
       self.__next()
-      self.__block()
+      return [self.__block()]
+    return []
 
-  def __loop(self):
-    self.__condition()
-    self.__block()
+  def __loop(self, while_tok):
+    cond = self.__condition()
+    return Node('while', while_tok, [cond, self.__block()])
 
   def __condition(self):
-    self.__expression()
+    left = self.__expression()
     if self.__has(Token.EQ) or self.__has(Token.NOEQ) or self.__has(
         Token.LT) or self.__has(Token.LTE) or self.__has(Token.GT):
-      self.__next()
-      self.__expression()
+      op = self.__take()
     else:
       self.__must_be(Token.GTE)
-      self.__next()
-      self.__expression()
+      op = self.__take()
+    return Node('cond', op, [left, self.__expression()])
 
   def __arg_list(self):
-    self.__expression()
-    self.__arg_list2()
+    args = [self.__expression()]
+    self.__arg_list2(args)
+    return args
 
-  def __arg_list2(self):
-    if self.__has(Token.COMMA):
+  def __arg_list2(self, args):
+    while self.__has(Token.COMMA):
       self.__next()
-      self.__expression()
-      self.__arg_list2()
+      args.append(self.__expression())
 
   def __ref(self):
     self.__must_be(Token.VARIABLE)
-    self.__next()
+    name = self.__take()
+    subscripts = []
     if self.__has(Token.LBRACK):
       self.__next()
-      self.__ref2()
+      subscripts = self.__ref2()
+    return Node('ref', name, subscripts)
 
   def __ref2(self):
-    self.__arg_list()
+    subscripts = self.__arg_list()
     self.__must_be(Token.RBRACK)
     self.__next()
+    return subscripts
 
   def __ref_list(self):
-    self.__ref()
-    self.__next()
-    self.__ref_list2()
+    refs = [self.__ref()]
+    self.__ref_list2(refs)
+    return refs
 
-  def __ref_list2(self):
-    if self.__has(Token.COMMA):
-      self.__next()
-      self.__ref()
+  def __ref_list2(self, refs):
+    while self.__has(Token.COMMA):
       self.__next()
-      self.__ref_list2()
+      refs.append(self.__ref())
 
   def __expression(self):
-    self.__term()
-    self.__expression2()
+    return self.__expression2(self.__term())
 
-  def __expression2(self):
-    if self.__has(Token.PLUS):
-      self.__next()
-      self.__term()
-      self.__expression2()
-    elif self.__has(Token.MINUS):
-      self.__next()
-      self.__term()
-      self.__expression2()
+  def __expression2(self, left):
+    while self.__has(Token.PLUS) or self.__has(Token.MINUS):
+      op = self.__take()
+      left = Node('binop', op, [left, self.__term()])
+    return left
 
   def __term(self):
-    self.__factor()
-    self.__term2()
+    return self.__term2(self.__factor())
 
-  def __term2(self):
-    if self.__has(Token.TIMES):
-      self.__next()
-      self.__factor()
-      self.__term2()
-    elif self.__has(Token.DIV):
-      self.__next()
-      self.__factor()
-      self.__term2()
+  def __term2(self, left):
+    while self.__has(Token.TIMES) or self.__has(Token.DIV):
+      op = self.__take()
+      left = Node('binop', op, [left, self.__factor()])
+    return left
 
   def __factor(self):
-    self.__exponent()
-    self.__factor2()
-
-  def __factor2(self):
-    if self.__has(Token.EXP):
-      self.__next()
-      self.__factor()
+    return self.__factor2(self.__exponent())
+
+  def __factor2(self, base):
+    #** groups to the right, so gather the whole chain and build the
+    #tree from its right end
+    bases = [base]
+    ops = []
+    while self.__has(Token.EXP):
+      ops.append(self.__take())
+      bases.append(self.__exponent())
+
+    factor = bases.pop()
+    while ops:
+      factor = Node('binop', ops.pop(), [bases.pop(), factor])
+    return factor
 
   def __exponent(self):
     if self.__has(Token.LPAREN):
       self.__next()
-      self.__expression()
+      expr = self.__expression()
       self.__must_be(Token.RPAREN)
       self.__next()
+      return expr
     elif self.__has(Token.VARIABLE):
-      self.__next()
+      name = self.__take()
       if self.__has(Token.LPAREN):
         self.__next()
-        self.__call()
+        return self.__call(name)
+      elif self.__has(Token.LBRACK):
+        self.__next()
+        return Node('ref', name, self.__ref2())
+      return Node('var', name)
     elif self.__has(Token.INTLIT):
-      self.__next()
+      return Node('literal', self.__take())
     elif self.__has(Token.STRING):
-      self.__next()
+      return Node('literal', self.__take())
     elif self.__has(Token.CHARLIT):
-      self.__next()
+      return Node('literal', self.__take())
     elif self.__must_be(Token.FLOATLIT):
-      self.__next()
+      return Node('literal', self.__take())
 
-  def __call(self):
+  def __call(self, name):
+    args = []
     if not self.__has(Token.RPAREN):
-      self.__arg_list()
+      args = self.__arg_list()
     self.__must_be(Token.RPAREN)
     self.__next()
+    return Node('call', name, args)
 
 
 # unit test
 if __name__ == "__main__":
   p = Parser(Lexer())
-  p.parse()
+  try:
+    p.parse()
+  except ParserError as e:
+    print(e)
+    sys.exit(-1)
@@ -0,0 +1,206 @@
+"""
+Regression checks for the lexer, parser, the passes over its tree and
+the runtime.
+
+Each check feeds one input that once went wrong to two parts that must
+agree on it (the plain lexer and the async one, the serial parser and
+the parallel one, the optimizer and the type checker), or runs a case
+that once hung, and fails if it goes wrong. Some of the bugs these catch
+were hangs, so a check also fails if it hasn't finished after --timeout
+seconds.
+
+    python regressions.py [--timeout SECONDS] [CHECK...]
+"""
+import io
+import os
+import sys
+import asyncio
+import argparse
+import threading
+import subprocess
+import multiprocessing
+from lexer import Token, Lexer
+from async_lexer import AsyncLexer
+from parser_start import Parser, ParserError
+from parallel import parse_parallel
+from optimize import optimize
+from typecheck import TypeChecker
+
+
+def sync_tokens(source):
+  lx = Lexer(io.StringIO(source))
+  tokens = []
+  while lx.next().token != Token.EOF:
+    tokens.append(lx.get_tok())
+  return tokens
+
+
+def async_tokens(source):
+  async def run():
+    reader = asyncio.StreamReader()
+    reader.feed_data(source.encode())
+    reader.feed_eof()
+    return [tok async for tok in AsyncLexer(reader)]
+
+  return asyncio.run(run())
+
+
+def check_async_operator_at_eof():
+  """
+    A stream closed straight after an operator that could have gone on
+    (* or <) used to spin forever.
+    """
+  for source in ('BEGIN\n  x := 1 *', 'BEGIN\n  x := y <'):
+    expected = sync_tokens(source)
+    got = async_tokens(source)
+    if got != expected:
+      return f"{source!r}: async gave {got}, expected {expected}"
+  return None
+
+
+def outcome(parse):
+  """
+    What parse() gives: ('tree', tree) or ('error', message).
+    """
+  try:
+    return 'tree', parse()
+  except ParserError as e:
+    return 'error', str(e)
+
+
+def check_parallel_operator_at_eof():
+  """
+    A declaration slice ending in an operator that could have gone on
+    (here `<`) hung the parallel parser, while the serial parser
+    reported the syntax error.
+    """
+  procs = ''.join(f'PROC p{i}() BEGIN x := {i} END\n' for i in range(10))
+  main = 'BEGIN\n  p0()\nEND\n'
+  for source in ('NUMBER x<' + procs + main, 'NUMBER x\n' + procs + main):
+    expected = outcome(lambda: Parser(Lexer(io.StringIO(source))).parse())
+    for threads in (False, True):
+      got = outcome(lambda: parse_parallel(source, jobs=4, threads=threads))
+      if got != expected:
+        return (f"{source[:12]!r}...: parallel (threads={threads}) gave "
+                f"{got}, expected {expected}")
+  return None
+
+
+def check_optimize_char_array():
+  """
+    Reusing a read of a CHARLIT array put it in a temporary declared
+    NUMBER, which the type checker then rejected.
+    """
+  reads = '  PRINT s[i]\n  PRINT s[i]\n'
+  for source in (
+      'CHARLIT s[10]\nNUMBER i\nBEGIN\n  i := 1\n' + reads + 'END\n',
+      # s means a different array inside p
+      'CHARLIT s[10]\nNUMBER i\nPROC p()\nBEGIN\n  NUMBER s[10]\n' + reads +
+      'END\nBEGIN\n  i := 1\n' + reads + 'END\n'):
+    tree = Parser(Lexer(io.StringIO(source))).parse()
+    if TypeChecker().check(tree):
+      return f"{source!r} doesn't type check to begin with"
+    errors = TypeChecker().check(optimize(tree)[0])
+    if errors:
+      return f"{source!r}: optimized program has type errors {errors}"
+  return None
+
+
+# asks for a number on stdout, reads it from stdin and prints it doubled
+PROMPT_PROGRAM = '''
+from runtime_io import Input, Output
+out = Output()
+inp = Input(tie=out)
+out.print('number?')
+out.print(inp.read_number() * 2)
+out.close()
+'''
+
+
+def check_prompt_over_pipe():
+  """
+    Reading a pipe waited for a whole chunk of input, so a program that
+    prompted and then read the answer never got it.
+    """
+  child = subprocess.Popen([sys.executable, '-c', PROMPT_PROGRAM],
+                           stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                           text=True,
+                           cwd=os.path.dirname(os.path.abspath(__file__)))
+  # a reply that never comes shows up as '' instead of hanging this check
+  killer = threading.Timer(5, child.kill)
+  killer.start()
+  try:
+    prompt = child.stdout.readline()
+    child.stdin.write('21\n')
+    child.stdin.flush()
+    answer = child.stdout.readline()
+  finally:
+    killer.cancel()
+    child.kill()
+    child.wait()
+  if (prompt, answer) != ('number?\n', '42\n'):
+    return f"got prompt {prompt!r} and answer {answer!r}"
+  return None
+
+
+# check name -> function returning None, or what went wrong
+CHECKS = {
+  'async-operator-at-eof': check_async_operator_at_eof,
+  'parallel-operator-at-eof': check_parallel_operator_at_eof,
+  'optimize-char-array': check_optimize_char_array,
+  'prompt-over-pipe': check_prompt_over_pipe,
+}
+
+
+def run_check(check, timeout):
+  """
+    Run one check on a daemon thread, so a hang can be given up on.
+    Returns None or what went wrong.
+    """
+  result = []
+
+  def run():
+    try:
+      result.append(check())
+    except Exception as e:
+      result.append(f"{type(e).__name__}: {e}")
+
+  thread = threading.Thread(target=run, daemon=True)
+  thread.start()
+  thread.join(timeout)
+  if not result:
+    return f"still running after {timeout} s"
+  return result[0]
+
+
+def main(argv=None):
+  ap = argparse.ArgumentParser(
+    description='Re-run inputs that once broke the lexer or parser.')
+  ap.add_argument('--timeout', type=float, default=10,
+                  help='seconds before a check counts as hung (default: 10)')
+  ap.add_argument('checks', nargs='*', metavar='CHECK',
+                  help=f"checks to run: {', '.join(CHECKS)} (default: all)")
+  args = ap.parse_args(argv)
+  for name in args.checks:
+    if name not in CHECKS:
+      ap.error(f"unknown check {name!r}")
+
+  failed = hung = 0
+  for name in args.checks or CHECKS:
+    problem = run_check(CHECKS[name], args.timeout)
+    failed += problem is not None
+    hung += problem is not None and problem.startswith('still running')
+    print(f"{name:26} {'ok' if problem is None else 'FAIL ' + problem}")
+    sys.stdout.flush()
+
+  if hung:
+    # a hung check leaves its thread, and maybe pool workers, spinning;
+    # exiting normally would wait for them forever
+    for child in multiprocessing.active_children():
+      child.terminate()
+    os._exit(1)
+  return 1 if failed else 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
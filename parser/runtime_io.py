@@ -0,0 +1,209 @@
+"""
+Buffered I/O for running FunLang PRINT and READ statements.
+
+Output collects what PRINT statements write and hands it to its stream
+in large writes: when the buffer passes buffer_size, when flush() is
+called, and when it is closed (or its with block ends). A PRINT writes
+its values separated by spaces, then a newline.
+
+Input reads its stream a big chunk at a time and splits each chunk into
+whitespace separated words in one go. A chunk is whatever has arrived,
+up to chunk_size, so reading a pipe or a terminal doesn't wait for a
+whole chunk to fill: a text stream over a binary buffer is read with
+read1() and decoded as it comes, and a terminal with no such buffer a
+line at a time. Input should then be the only thing reading the stream,
+since text the stream itself has already buffered isn't seen. READ then takes values off that
+list. A word cut in two by the end of a chunk is put back together
+before it is used. read_numbers() takes a whole run of words at once,
+which is how a declared array is filled by one READ:
+
+    values = inp.read_numbers(declared_size(decl))
+
+An Input can be tied to an Output. The output is then flushed just
+before the input has to wait for more data, so a prompt is always
+written before the program stops to read its answer, but flushing
+doesn't happen once per value.
+"""
+import sys
+import codecs
+
+CHUNK_SIZE = 65536
+
+
+class ReadError(Exception):
+  """
+    READ couldn't get a value: bad data, or the input ran out.
+    """
+
+
+def declared_size(decl):
+  """
+    Number of elements in a 'decl' node: the product of its bounds, or 1
+    for a plain variable.
+    """
+  size = 1
+  for bound in decl.children[1:]:
+    size *= bound.token.value
+  return size
+
+
+def _number(word):
+  try:
+    return int(word)
+  except ValueError:
+    pass
+  try:
+    return float(word)
+  except ValueError:
+    raise ReadError(f"expected a number, got {word!r}") from None
+
+
+def _reader(stream, chunk_size):
+  """
+    A function returning the next piece of stream's text, as soon as
+    there is any, at most chunk_size long; '' at the end of the stream.
+    """
+  buffer = getattr(stream, 'buffer', None)
+  if buffer is not None and hasattr(buffer, 'read1'):
+    # read1() returns what has arrived rather than waiting for chunk_size
+    decoder = codecs.getincrementaldecoder(
+      getattr(stream, 'encoding', None) or 'utf-8')(
+        getattr(stream, 'errors', None) or 'strict')
+
+    def read():
+      while True:
+        data = buffer.read1(chunk_size)
+        text = decoder.decode(data, final=not data)
+        # otherwise only part of a multi-byte character has arrived
+        if text or not data:
+          return text
+
+    return read
+
+  isatty = getattr(stream, 'isatty', None)
+  if isatty is not None and isatty():
+    return lambda: stream.readline(chunk_size)
+  return lambda: stream.read(chunk_size)
+
+
+class Output:
+  """
+    Buffered output for PRINT.
+    """
+
+  def __init__(self, stream=None, buffer_size=CHUNK_SIZE):
+    self.__stream = stream if stream is not None else sys.stdout
+    self.__buffer_size = buffer_size
+    self.__parts = []
+    self.__size = 0
+
+  def print(self, *values):
+    """
+        Write the values of one PRINT statement.
+        """
+    line = ' '.join(map(str, values)) + '\n'
+    self.__parts.append(line)
+    self.__size += len(line)
+    if self.__size >= self.__buffer_size:
+      self.flush()
+
+  def flush(self):
+    if self.__parts:
+      self.__stream.write(''.join(self.__parts))
+      self.__parts = []
+      self.__size = 0
+    self.__stream.flush()
+
+  def close(self):
+    self.flush()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+class Input:
+  """
+    Chunked input for READ.
+    """
+
+  def __init__(self, stream=None, tie=None, chunk_size=CHUNK_SIZE):
+    self.__stream = stream if stream is not None else sys.stdin
+    self.__tie = tie
+    self.__read = _reader(self.__stream, chunk_size)
+    self.__words = []
+    self.__next = 0
+    #a word cut off by the end of the last chunk
+    self.__partial = ''
+    self.__eof = False
+
+  def __more(self):
+    #Read chunks until there are words to take. Returns False at the end.
+    while self.__next >= len(self.__words):
+      if self.__eof:
+        return False
+      if self.__tie is not None:
+        self.__tie.flush()
+
+      data = self.__read()
+      if not data:
+        self.__eof = True
+        data = ''
+      data = self.__partial + data
+      self.__words = data.split()
+      self.__next = 0
+      self.__partial = ''
+      if not self.__eof and self.__words and not data[-1].isspace():
+        # the last word might go on in the next chunk
+        self.__partial = self.__words.pop()
+    return True
+
+  def read_word(self):
+    """
+        The next whitespace separated word.
+        """
+    if not self.__more():
+      raise ReadError("ran out of input")
+    word = self.__words[self.__next]
+    self.__next += 1
+    return word
+
+  def read_number(self):
+    """
+        The next value READ into a NUMBER.
+        """
+    return _number(self.read_word())
+
+  def read_char(self):
+    """
+        The next value READ into a CHARLIT: the next character that
+        isn't whitespace.
+        """
+    if not self.__more():
+      raise ReadError("ran out of input")
+    word = self.__words[self.__next]
+    if len(word) > 1:
+      self.__words[self.__next] = word[1:]
+    else:
+      self.__next += 1
+    return word[0]
+
+  def read_numbers(self, count):
+    """
+        The next count values, for filling an array.
+        """
+    values = []
+    while len(values) < count:
+      if not self.__more():
+        raise ReadError(f"ran out of input after {len(values)} of "
+                        f"{count} values")
+      take = self.__words[self.__next:self.__next + count - len(values)]
+      self.__next += len(take)
+      try:
+        # whole numbers are the common case, and convert in bulk
+        values.extend(list(map(int, take)))
+      except ValueError:
+        values.extend(map(_number, take))
+    return values
@@ -0,0 +1,164 @@
+"""
+Scaling checks for the lexer and parser.
+
+Each axis builds programs that grow along one dimension (string length,
+length of a run of whitespace, number of identifiers, nesting depth,
+argument list length, amount of comment), doubling the size each step.
+Every program is lexed and parsed and timed, and a straight line is
+fitted to log(time) against log(size). The async-* axes instead time
+AsyncLexer tokenizing the program from a stream read in small chunks,
+with strings and comments spanning many of them.
+The slope of that line is how the time grows: about 1 for linear, 2 for
+quadratic. An axis fails if its slope is over --max-slope.
+
+    python scaling.py [--max-slope SLOPE] [--steps N] [AXIS...]
+
+Everything runs at Python's default recursion limit, the way the
+parser is normally used. An axis whose programs don't parse there (say,
+a production that recurses once per list element) fails, and the error
+is reported. The parser recurses once per nested block, so the nesting
+axis repeats its nest enough times to be worth timing rather than going
+deeper than the limit allows.
+"""
+import io
+import sys
+import math
+import timeit
+import asyncio
+import argparse
+from lexer import Lexer
+from async_lexer import AsyncLexer
+from parser_start import Parser, ParserError
+
+# copies of the nest in a nesting program
+NESTS = 64
+
+# bytes the async front end reads from its stream at a time
+ASYNC_CHUNK = 4096
+
+
+def string_program(n):
+  return 'BEGIN\n  PRINT "' + 'a' * n + '"\nEND\n'
+
+
+def whitespace_program(n):
+  return 'BEGIN\n  x := 1' + '\n' * n + 'END\n'
+
+
+def identifier_program(n):
+  return 'BEGIN\n' + ''.join(f'  v{i} := v{i} + 1\n' for i in range(n)) + 'END\n'
+
+
+def nesting_program(n):
+  nest = 'WHILE x < 1 BEGIN\n' * n + 'x := x + 1\n' + 'END\n' * n
+  return 'BEGIN\n' + nest * NESTS + 'END\n'
+
+
+def arg_list_program(n):
+  return 'BEGIN\n  PRINT ' + ', '.join(str(i) for i in range(n)) + '\nEND\n'
+
+
+def comment_program(n):
+  return ('BEGIN\n' + '  # a comment, with BEGIN and "quotes" in it\n' * n +
+          '  x := 1\nEND\n')
+
+
+def long_comment_program(n):
+  return '# ' + 'a' * n + '\nBEGIN\n  x := 1\nEND\n'
+
+
+def parse(source):
+  Parser(Lexer(io.StringIO(source))).parse()
+
+
+def async_lex(source):
+  async def run():
+    reader = asyncio.StreamReader()
+    reader.feed_data(source.encode())
+    reader.feed_eof()
+    async for _ in AsyncLexer(reader, chunk_size=ASYNC_CHUNK):
+      pass
+
+  asyncio.run(run())
+
+
+# axis name -> (program builder, smallest size, what is timed)
+AXES = {
+  'string': (string_program, 131072, parse),
+  'whitespace': (whitespace_program, 262144, parse),
+  'identifiers': (identifier_program, 256, parse),
+  'nesting': (nesting_program, 4, parse),
+  'arg-list': (arg_list_program, 256, parse),
+  'comments': (comment_program, 512, parse),
+  'async-string': (string_program, 131072, async_lex),
+  'async-comment': (long_comment_program, 1048576, async_lex),
+}
+
+
+def run_time(run, source, repeat=3):
+  """
+    Best time, in seconds, of run(source).
+    """
+  timer = timeit.Timer(lambda: run(source))
+  number, _ = timer.autorange()
+  return min(timer.repeat(repeat, number)) / number
+
+
+def slope(sizes, times):
+  """
+    Least squares slope of log(times) against log(sizes).
+    """
+  xs = [math.log(s) for s in sizes]
+  ys = [math.log(t) for t in times]
+  mx = sum(xs) / len(xs)
+  my = sum(ys) / len(ys)
+  return (sum((x - mx) * (y - my) for x, y in zip(xs, ys)) /
+          sum((x - mx) ** 2 for x in xs))
+
+
+def measure(axis, steps=6):
+  """
+    Time one axis over steps doublings.
+    Returns (sizes, times, slope).
+    """
+  build, base, run = AXES[axis]
+  sizes = [base << i for i in range(steps)]
+  times = [run_time(run, build(n)) for n in sizes]
+  return sizes, times, slope(sizes, times)
+
+
+def main(argv=None):
+  ap = argparse.ArgumentParser(
+    description='Check that lexing and parsing time grows near-linearly.')
+  ap.add_argument('--max-slope', type=float, default=1.3,
+                  help='largest log-log slope that passes (default: 1.3)')
+  ap.add_argument('--steps', type=int, default=6,
+                  help='number of doublings per axis (default: 6)')
+  ap.add_argument('axes', nargs='*', metavar='AXIS',
+                  help=f"axes to check: {', '.join(AXES)} (default: all)")
+  args = ap.parse_args(argv)
+  for axis in args.axes:
+    if axis not in AXES:
+      ap.error(f"unknown axis {axis!r}")
+
+  failed = 0
+  for axis in args.axes or AXES:
+    try:
+      sizes, times, growth = measure(axis, args.steps)
+    except (ParserError, RecursionError) as e:
+      failed += 1
+      print(f"{axis:14} FAIL {' '.join(str(e).split())}")
+      sys.stdout.flush()
+      continue
+    ok = growth <= args.max_slope
+    failed += not ok
+    print(f"{axis:14} slope {growth:5.2f}  {'ok' if ok else 'FAIL'}")
+    for n, t in zip(sizes, times):
+      print(f"  {n:>9} {t * 1000:10.3f} ms")
+    sys.stdout.flush()
+
+  return 1 if failed else 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
@@ -0,0 +1,226 @@
+"""
+Cross-file index of FunLang symbols.
+
+Records, for every file indexed, where each PROC, function, variable and
+parameter is declared, every call, every assignment and every other
+reference to a variable. The index is an SQLite database on disk, read
+through mmap, with the symbols indexed by name, so a lookup is one
+B-tree search however many files there are.
+
+Updating only parses what changed. A file whose size and modification
+time are what they were is skipped without being read. Otherwise its
+contents are hashed, and only if the hash differs is it parsed again,
+in a process pool, and its old symbols replaced. Files that no longer
+exist are dropped. A file with a syntax error keeps the symbols from the
+declarations before the error, and the error is reported.
+
+    python symindex.py [--db DB] update [-j JOBS] FILE_OR_GLOB...
+    python symindex.py [--db DB] defs NAME
+    python symindex.py [--db DB] uses NAME
+"""
+import os
+import sys
+import sqlite3
+import hashlib
+import argparse
+from stat import S_ISREG
+from concurrent.futures import ProcessPoolExecutor
+from lexer import Lexer
+from parser_start import Parser
+from batch import available_cores, diagnostic, expand
+
+# node kinds that declare a name, and those that use one
+DEFINITIONS = ('proc', 'fun', 'decl', 'param')
+USES = ('call', 'assign', 'swap', 'var', 'ref')
+
+SCHEMA = '''
+  CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    hash TEXT NOT NULL
+  );
+  CREATE TABLE IF NOT EXISTS symbols (
+    name TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    file INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    line INTEGER NOT NULL,
+    col INTEGER NOT NULL
+  );
+  CREATE INDEX IF NOT EXISTS symbols_by_name ON symbols(name, kind);
+  CREATE INDEX IF NOT EXISTS symbols_by_file ON symbols(file);
+'''
+
+# how much of the database SQLite may map into memory
+MMAP_SIZE = 1 << 30
+
+
+def file_hash(path):
+  with open(path, 'rb') as f:
+    return hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+
+
+def scan_file(path):
+  """
+    Find the symbols in one file.
+    Returns (path, [(name, kind, line, col)...], error or None).
+    """
+  rows = []
+  try:
+    with open(path) as f:
+      # one top-level declaration at a time, so a big file isn't held
+      # as one tree
+      for decl in Parser(Lexer(f)).declarations():
+        stack = [decl]
+        while stack:
+          node = stack.pop()
+          if node.kind in DEFINITIONS or node.kind in USES:
+            tok = node.token
+            rows.append((tok.lexeme, node.kind, tok.line, tok.col))
+          stack.extend(node.children)
+  except Exception as e:
+    return path, rows, diagnostic(e)
+  return path, rows, None
+
+
+class SymbolIndex:
+  """
+    An index database. Use as a context manager, or close() it.
+    """
+
+  def __init__(self, db):
+    self.__db = sqlite3.connect(db)
+    self.__db.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    self.__db.execute("PRAGMA journal_mode = WAL")
+    self.__db.execute("PRAGMA foreign_keys = ON")
+    self.__db.executescript(SCHEMA)
+
+  def close(self):
+    self.__db.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+  def update(self, paths, jobs=None):
+    """
+        Bring the index up to date with paths (and drop indexed files that
+        have gone). Returns (files parsed, [(path, error)...]).
+        """
+    db = self.__db
+    known = {row[0]: row[1:] for row in
+             db.execute("SELECT path, id, size, mtime, hash FROM files")}
+
+    changed = {}
+    errors = []
+    for path in paths:
+      path = os.path.abspath(path)
+      try:
+        st = os.stat(path)
+      except OSError as e:
+        errors.append((path, str(e)))
+        continue
+      if not S_ISREG(st.st_mode):
+        errors.append((path, "not a regular file"))
+        continue
+      old = known.get(path)
+      if old is not None and old[1:3] == (st.st_size, st.st_mtime_ns):
+        continue
+      try:
+        digest = file_hash(path)
+      except OSError as e:
+        # unreadable, or gone since the stat
+        errors.append((path, str(e)))
+        continue
+      if old is not None and old[3] == digest:
+        # touched but not changed
+        db.execute("UPDATE files SET size = ?, mtime = ? WHERE id = ?",
+                   (st.st_size, st.st_mtime_ns, old[0]))
+        continue
+      changed[path] = (st.st_size, st.st_mtime_ns, digest)
+
+    for path, old in known.items():
+      if not os.path.exists(path):
+        db.execute("DELETE FROM files WHERE id = ?", (old[0],))
+
+    if changed:
+      jobs = jobs or available_cores()
+      with ProcessPoolExecutor(max_workers=jobs) as pool:
+        chunksize = max(1, len(changed) // (jobs * 4))
+        for path, rows, error in pool.map(scan_file, changed,
+                                          chunksize=chunksize):
+          if error is not None:
+            errors.append((path, error))
+          self.__store(path, changed[path], rows)
+
+    db.commit()
+    return len(changed), errors
+
+  def __store(self, path, stat, rows):
+    db = self.__db
+    db.execute("DELETE FROM files WHERE path = ?", (path,))
+    file_id = db.execute(
+      "INSERT INTO files (path, size, mtime, hash) VALUES (?, ?, ?, ?)",
+      (path,) + stat).lastrowid
+    db.executemany(
+      "INSERT INTO symbols (name, kind, file, line, col) VALUES (?, ?, ?, ?, ?)",
+      ((name, kind, file_id, line, col) for name, kind, line, col in rows))
+
+  def __lookup(self, name, kinds):
+    return self.__db.execute(
+      f"""SELECT files.path, symbols.line, symbols.col, symbols.kind
+          FROM symbols JOIN files ON files.id = symbols.file
+          WHERE symbols.name = ? AND symbols.kind IN
+            ({', '.join('?' * len(kinds))})
+          ORDER BY files.path, symbols.line, symbols.col""",
+      (name,) + kinds).fetchall()
+
+  def definitions(self, name):
+    """
+        Where name is declared.
+        Returns [(path, line, col, kind)...].
+        """
+    return self.__lookup(name, DEFINITIONS)
+
+  def uses(self, name):
+    """
+        Where name is called, assigned or referred to.
+        Returns [(path, line, col, kind)...].
+        """
+    return self.__lookup(name, USES)
+
+
+def main(argv=None):
+  ap = argparse.ArgumentParser(description='Index FunLang symbols.')
+  ap.add_argument('--db', default='funlang.idx',
+                  help='index database (default: funlang.idx)')
+  commands = ap.add_subparsers(dest='command', required=True)
+  update = commands.add_parser('update', help='index files')
+  update.add_argument('-j', '--jobs', type=int, default=None,
+                      help='number of worker processes (default: all cores)')
+  update.add_argument('files', nargs='+', help='files or glob patterns')
+  for command in ('defs', 'uses'):
+    commands.add_parser(command, help=f'list the {command} of a name'
+                        ).add_argument('name')
+  args = ap.parse_args(argv)
+
+  with SymbolIndex(args.db) as index:
+    if args.command == 'update':
+      parsed, errors = index.update(expand(args.files), args.jobs)
+      for path, error in errors:
+        print(f"{path}: {error}")
+      print(f"{parsed} file(s) indexed")
+      return 1 if errors else 0
+
+    found = (index.definitions(args.name) if args.command == 'defs' else
+             index.uses(args.name))
+    for path, line, col, kind in found:
+      print(f"{path}:{line}:{col}: {kind}")
+    return 0 if found else 1
+
+
+if __name__ == "__main__":
+  sys.exit(main())
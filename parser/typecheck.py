@@ -0,0 +1,423 @@
+"""
+Static types for FunLang expressions.
+
+TypeChecker works out the type of every expression and condition in a
+parse tree before anything runs, so an engine can pick a specialised
+operation (int add, float compare...) instead of a generic one, and so
+type errors are found up front.
+
+The types are
+
+    INT      a NUMBER only ever holding whole numbers
+    FLOAT    a NUMBER that can hold a fraction
+    NUMBER   a NUMBER that can't be pinned down (READ, parameters,
+             function results)
+    CHAR     a CHARLIT
+    STRING   a string literal, or a CHARLIT assigned one
+
+Literals have the type their token says. A variable's type is the join
+of everything assigned to it, anywhere in its scope, worked out to a
+fixed point: INT and FLOAT join to FLOAT, and anything joined with
+NUMBER is NUMBER. An arithmetic expression has the join of its operand
+types, and so does a condition, which is the type its comparison works
+on. / and ** also join in FLOAT, since 7 / 2 and 2 ** (0 - 1) aren't
+whole numbers: they are FLOAT, or NUMBER with a NUMBER operand, never
+INT.
+
+Scopes are the program (top-level declarations), the main block and
+each PROC or function, which can also see the scopes it is nested in.
+Declarations anywhere in a body belong to the body. A name that is
+assigned or READ but never declared belongs to the scope it is written
+in.
+
+    python typecheck.py [--types] FILE
+"""
+import sys
+import argparse
+from lexer import Token, Lexer
+from parser_start import Parser, ParserError
+
+INT = 'int'
+FLOAT = 'float'
+NUMBER = 'number'
+CHAR = 'char'
+STRING = 'string'
+
+NUMERIC = (INT, FLOAT, NUMBER)
+
+# operators whose result can be a fraction whatever their operands are
+FRACTIONAL = (Token.DIV, Token.EXP)
+
+LITERALS = {Token.INTLIT: INT, Token.FLOATLIT: FLOAT, Token.CHARLIT: CHAR,
+            Token.STRING: STRING}
+
+# what a declared type starts out as
+DECLARED = {Token.NUMTYPE: None, Token.CHARTYPE: CHAR}
+
+
+def join(a, b):
+  """
+    The type that can hold values of both a and b.
+    a and b must both be NUMERIC, or both not.
+    """
+  if a is None or a == b:
+    return b
+  elif b is None:
+    return a
+  elif NUMBER in (a, b):
+    return NUMBER
+  elif FLOAT in (a, b):
+    return FLOAT
+  return STRING
+
+
+def describe(t):
+  return 'NUMBER' if t in NUMERIC else 'CHARLIT' if t == CHAR else 'string'
+
+
+class Symbol:
+  '''
+    A variable. declared is its NUMTYPE/CHARTYPE token (None if it was
+    never declared), bounds how many subscripts it takes (None if that
+    isn't known), and type what it has been found to hold so far.
+    '''
+  __slots__ = ('name', 'declared', 'bounds', 'type')
+
+  def __init__(self, name, declared=None, bounds=None):
+    self.name = name
+    self.declared = declared
+    self.bounds = bounds
+    self.type = DECLARED[declared.token] if declared else None
+
+  def numeric(self):
+    #True for a NUMBER, False for a CHARLIT, None if it can't be told yet
+    if self.declared is not None:
+      return self.declared.token == Token.NUMTYPE
+    return None if self.type is None else self.type in NUMERIC
+
+
+class Scope:
+  '''
+    The variables of a program, block or function, and the scope around it.
+    '''
+  __slots__ = ('symbols', 'parent')
+
+  def __init__(self, parent=None):
+    self.symbols = {}
+    self.parent = parent
+
+  def lookup(self, name):
+    scope = self
+    while scope is not None:
+      if name in scope.symbols:
+        return scope.symbols[name]
+      scope = scope.parent
+    return None
+
+
+class TypeChecker:
+  """
+    Works out expression types and finds type errors.
+    """
+
+  def __init__(self):
+    self.errors = []
+    self.__types = {}
+    self.__functions = {}
+    #(scope, statements) for the program, main block and every function
+    self.__bodies = []
+    self.__report = False
+    self.__changed = False
+
+  def type_of(self, node):
+    """
+        The type check() found for an expression, or for the operands of a
+        condition. None if it couldn't be worked out (there was an error).
+        """
+    return self.__types.get(id(node))
+
+  def check(self, tree):
+    """
+        Check a 'program' tree.
+        Returns the list of errors, empty if there were none.
+        """
+    self.__report = True
+    program = Scope()
+    for node in tree.children:
+      if node.kind == 'decl':
+        self.__declare(program, node)
+      elif node.kind == 'block':
+        self.__body(Scope(program), node)
+      else:
+        self.__function(program, node)
+
+    # variable types only ever grow, so this settles
+    self.__report = False
+    self.__settle()
+    # anything declared NUMBER and never given a value could hold anything
+    for scope, statements in self.__bodies:
+      for symbol in scope.symbols.values():
+        if symbol.type is None and symbol.numeric():
+          symbol.type = NUMBER
+    self.__settle()
+
+    self.__report = True
+    self.__run()
+    return self.errors
+
+  def __settle(self):
+    self.__changed = True
+    while self.__changed:
+      self.__changed = False
+      self.__run()
+
+  def __run(self):
+    for scope, statements in self.__bodies:
+      for stmt in statements:
+        self.__statement(scope, stmt)
+
+  def __error(self, token, message):
+    if self.__report:
+      self.errors.append(f"line {token.line}, column {token.col}: {message}")
+
+  def __declare(self, scope, decl):
+    type_tok = decl.children[0].token
+    symbol = scope.symbols.get(decl.token.lexeme)
+    if symbol is None:
+      scope.symbols[decl.token.lexeme] = Symbol(
+        decl.token.lexeme, type_tok, len(decl.children) - 1)
+    elif symbol.declared.token != type_tok.token:
+      self.__error(decl.token, f"{decl.token.lexeme} is declared as both "
+                   f"{symbol.declared.lexeme} and {type_tok.lexeme}")
+
+  def __function(self, parent, node):
+    name = node.token.lexeme
+    if name in self.__functions:
+      self.__error(node.token, f"{name} is defined more than once")
+    self.__functions[name] = node
+
+    scope = Scope(parent)
+    for param in node.children:
+      if param.kind == 'param':
+        symbol = Symbol(param.token.lexeme, param.children[0].token, 0)
+        # callers can pass anything of the right kind
+        symbol.type = NUMBER if symbol.numeric() else CHAR
+        scope.symbols[symbol.name] = symbol
+    self.__body(scope, node.children[-1])
+
+  def __body(self, scope, block):
+    """
+        Set up the body of a function, or the main block, in scope.
+        """
+    statements = []
+    self.__collect(scope, statements, block)
+    self.__bodies.append((scope, statements))
+
+    # names written without being declared anywhere belong to this body
+    for stmt in statements:
+      targets = []
+      if stmt.kind in ('assign', 'swap'):
+        targets.append(stmt.token.lexeme)
+      if stmt.kind in ('swap', 'read'):
+        targets += [ref.token.lexeme for ref in stmt.children
+                    if ref.kind == 'ref']
+      for name in targets:
+        if scope.lookup(name) is None:
+          scope.symbols[name] = Symbol(name)
+
+  def __collect(self, scope, statements, block):
+    #Gather the statements of block, and the blocks inside it, declaring
+    #what they declare. Functions defined inside get their own scope.
+    for stmt in block.children:
+      statements.append(stmt)
+      if stmt.kind == 'decl':
+        self.__declare(scope, stmt)
+      elif stmt.kind in ('proc', 'fun'):
+        self.__function(scope, stmt)
+      elif stmt.kind in ('if', 'while', 'block'):
+        for child in stmt.children:
+          if child.kind == 'block':
+            self.__collect(scope, statements, child)
+
+  def __assign(self, symbol, t, token):
+    #Record that t is stored in symbol
+    if t is None:
+      return
+
+    numeric = symbol.numeric()
+    if numeric is not None and numeric != (t in NUMERIC):
+      kind = symbol.declared.lexeme if symbol.declared else describe(symbol.type)
+      self.__error(token, f"can't store a {describe(t)} in {symbol.name}, "
+                   f"which is a {kind}")
+      return
+
+    new = join(symbol.type, t)
+    if new != symbol.type:
+      symbol.type = new
+      self.__changed = True
+
+  def __symbol(self, scope, token):
+    symbol = scope.lookup(token.lexeme)
+    if symbol is None:
+      self.__error(token, f"{token.lexeme} is not defined")
+    return symbol
+
+  def __subscripts(self, scope, symbol, token, subscripts):
+    #Check the subscripts used on symbol
+    for expr in subscripts:
+      t = self.__expr(scope, expr)
+      if t is not None and t not in NUMERIC:
+        self.__error(token, f"subscript of {token.lexeme} is a {describe(t)}, "
+                     f"not a NUMBER")
+
+    if symbol.bounds is None or not subscripts:
+      return
+    if symbol.bounds == 0:
+      self.__error(token, f"{token.lexeme} is not an array")
+    elif len(subscripts) != symbol.bounds:
+      self.__error(token, f"{token.lexeme} takes {symbol.bounds} "
+                   f"subscript(s), not {len(subscripts)}")
+
+  def __statement(self, scope, stmt):
+    kind = stmt.kind
+    if kind == 'assign':
+      symbol = self.__symbol(scope, stmt.token)
+      subscripts = stmt.children[:-1]
+      t = self.__expr(scope, stmt.children[-1])
+      if symbol is None:
+        return
+      self.__subscripts(scope, symbol, stmt.token, subscripts)
+      if symbol.bounds and not subscripts and t != STRING:
+        self.__error(stmt.token, f"{symbol.name} is an array")
+      self.__assign(symbol, t, stmt.token)
+    elif kind == 'swap':
+      ref = stmt.children[-1]
+      left = self.__symbol(scope, stmt.token)
+      right = self.__symbol(scope, ref.token)
+      if left is None or right is None:
+        return
+      self.__subscripts(scope, left, stmt.token, stmt.children[:-1])
+      self.__subscripts(scope, right, ref.token, ref.children)
+      self.__assign(left, right.type, stmt.token)
+      self.__assign(right, left.type, ref.token)
+    elif kind == 'read':
+      for ref in stmt.children:
+        symbol = self.__symbol(scope, ref.token)
+        if symbol is not None:
+          self.__subscripts(scope, symbol, ref.token, ref.children)
+          self.__assign(symbol, NUMBER if symbol.numeric() is not False
+                        else CHAR, ref.token)
+    elif kind == 'print':
+      for expr in stmt.children:
+        self.__expr(scope, expr)
+    elif kind in ('if', 'while'):
+      # the blocks are statements of this body too
+      self.__condition(scope, stmt.children[0])
+    elif kind in ('binop', 'var', 'literal', 'ref', 'call'):
+      self.__expr(scope, stmt, value=False)
+
+  def __condition(self, scope, cond):
+    left = self.__expr(scope, cond.children[0])
+    right = self.__expr(scope, cond.children[1])
+    if left is None or right is None:
+      return
+    if (left in NUMERIC) != (right in NUMERIC):
+      self.__error(cond.token, f"can't compare a {describe(left)} "
+                   f"with a {describe(right)}")
+      return
+    self.__types[id(cond)] = join(left, right)
+
+  def __expr(self, scope, node, value=True):
+    """
+        Type of an expression, or None if it has an error in it.
+        value is False for a call whose result isn't used.
+        """
+    kind = node.kind
+    t = None
+    if kind == 'literal':
+      t = LITERALS[node.token.token]
+    elif kind in ('var', 'ref'):
+      symbol = self.__symbol(scope, node.token)
+      if symbol is not None:
+        self.__subscripts(scope, symbol, node.token, node.children)
+        t = symbol.type
+    elif kind == 'binop':
+      left = self.__expr(scope, node.children[0])
+      right = self.__expr(scope, node.children[1])
+      for side in (left, right):
+        if side is not None and side not in NUMERIC:
+          self.__error(node.token, f"can't use {node.token.lexeme} "
+                       f"on a {describe(side)}")
+          return None
+      if left is not None and right is not None:
+        t = join(left, right)
+        if node.token.token in FRACTIONAL:
+          t = join(t, FLOAT)
+    elif kind == 'call':
+      t = self.__call(scope, node, value)
+
+    if t is not None:
+      self.__types[id(node)] = t
+    return t
+
+  def __call(self, scope, node, value):
+    name = node.token.lexeme
+    fun = self.__functions.get(name)
+    args = [self.__expr(scope, arg) for arg in node.children]
+    if fun is None:
+      self.__error(node.token, f"{name} is not a PROC or function")
+      return None
+
+    params = [p for p in fun.children if p.kind == 'param']
+    if len(args) != len(params):
+      self.__error(node.token, f"{name} takes {len(params)} argument(s), "
+                   f"not {len(args)}")
+    for arg, param in zip(args, params):
+      numeric = param.children[0].token.token == Token.NUMTYPE
+      if arg is not None and (arg in NUMERIC) != numeric:
+        self.__error(node.token, f"{param.token.lexeme} of {name} is a "
+                     f"{param.children[0].token.lexeme}, not a {describe(arg)}")
+
+    if fun.kind == 'proc':
+      if value:
+        self.__error(node.token, f"PROC {name} doesn't give a value")
+      return None
+    return NUMBER if fun.children[0].token.token == Token.NUMTYPE else CHAR
+
+
+def main(argv=None):
+  ap = argparse.ArgumentParser(description='Type check a FunLang file.')
+  ap.add_argument('--types', action='store_true',
+                  help='also list the type of every expression')
+  ap.add_argument('file')
+  args = ap.parse_args(argv)
+
+  try:
+    with open(args.file) as f:
+      tree = Parser(Lexer(f)).parse()
+  except ParserError as e:
+    print(e)
+    return -1
+
+  checker = TypeChecker()
+  errors = checker.check(tree)
+  if args.types:
+    for node in _expressions(tree):
+      t = checker.type_of(node)
+      if t is not None:
+        print(f"line {node.token.line}, column {node.token.col}: "
+              f"{node.kind} {node.token.lexeme} is {t}")
+  for error in errors:
+    print(error)
+  return -1 if errors else 0
+
+
+def _expressions(node):
+  if node.kind in ('binop', 'var', 'literal', 'ref', 'call', 'cond'):
+    yield node
+  for child in node.children:
+    yield from _expressions(child)
+
+
+if __name__ == "__main__":
+  sys.exit(main())